@@ -1,8 +1,9 @@
 from flask import Flask, request, abort
-import json
+import os
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+from jose import jwt, JWTError
+
+from fsnd_auth import JWKSCache, verify_signature
 
 
 app = Flask(__name__)
@@ -11,6 +12,15 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# Signing keys are fetched once and shared by every request,
+# set JWKS_PATH to read them from a local file instead.
+jwks_cache = JWKSCache(
+    url=f'https://{AUTH0_DOMAIN}/.well-known/jwks.json',
+    path=os.environ.get('JWKS_PATH'),
+    ttl=int(os.environ.get('JWKS_CACHE_TTL', 600)),
+    min_refresh_interval=int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+)
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -52,33 +62,25 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
     if rsa_key:
         try:
+            if unverified_header.get('alg') not in ALGORITHMS or not verify_signature(token, rsa_key):
+                raise JWTError('Signature verification failed.')
             payload = jwt.decode(
                 token,
-                rsa_key,
+                None,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                issuer='https://' + AUTH0_DOMAIN + '/',
+                options={'verify_signature': False}
             )
 
             return payload
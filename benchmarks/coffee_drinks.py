@@ -0,0 +1,74 @@
+'''
+Throughput of the public GET /drinks endpoint of the coffee shop backend.
+
+Fills a scratch sqlite database with drinks and requests GET /drinks through
+the Flask test client. Warm requests are answered by the response cache,
+--uncached invalidates it before every request so the body is built again,
+--cold also clears the decoded recipe cache, which measures the cost of
+parsing every recipe on each request. Every drink has a distinct recipe.
+
+    python benchmarks/coffee_drinks.py
+    python benchmarks/coffee_drinks.py --drinks 10000 --requests 50 --cold --gzip
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'projects',
+                           '03_coffee_shop_full_stack', 'starter_code', 'backend')
+COLORS = ['#6f4e37', '#ffffff', '#c0a080', '#3b2f2f']
+
+
+def recipe(number):
+    # every drink gets its own recipe, the first ingredient is named after it
+    return [{'name': 'blend %d' % number if part == 0 else 'ingredient %d' % part,
+             'color': COLORS[(number + part) % len(COLORS)], 'parts': part + 1}
+            for part in range(number % 3 + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drinks', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--uncached', action='store_true', help='build the response body on every request')
+    parser.add_argument('--cold', action='store_true', help='build the body and decode every recipe on every request')
+    parser.add_argument('--gzip', action='store_true', help='accept gzip encoded responses')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from src.database import models
+    database_file = os.path.join(tempfile.mkdtemp(), 'drinks.db')
+    # the checked in database must not be touched, point the app to a scratch one before it is created
+    models.database_path = 'sqlite:///{}'.format(database_file)
+    from src.api import app, response_cache
+
+    with app.app_context():
+        models.db.create_all()
+        models.db.session.execute(models.Drink.__table__.insert(), [
+            {'title': 'drink %d' % number, 'recipe': json.dumps(recipe(number))}
+            for number in range(args.drinks)])
+        models.db.session.commit()
+
+    client = app.test_client()
+    headers = {'Accept-Encoding': 'gzip'} if args.gzip else {}
+    client.get('/drinks', headers=headers)
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        if args.uncached or args.cold:
+            response_cache.invalidate()
+        if args.cold:
+            models.recipe_cache.clear()
+        response = client.get('/drinks', headers=headers)
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    mode = 'cold' if args.cold else 'uncached' if args.uncached else 'cached'
+    print('{} drinks, {} {} requests: {:.1f} ms/request, {:.1f} requests/s, {} bytes/response'.format(
+        args.drinks, args.requests, mode,
+        elapsed / args.requests * 1000, args.requests / elapsed, len(response.data)))
+
+
+if __name__ == '__main__':
+    main()
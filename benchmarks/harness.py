@@ -0,0 +1,313 @@
+'''
+Helpers shared by the load benchmarks: bulk seeding, driving the routes of a
+Flask application through its test client or a local WSGI server, latency
+percentiles, signed test tokens and JSON result files.
+'''
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROJECTS_DIR = os.path.join(ROOT_DIR, 'projects')
+SEED_CHUNK_SIZE = 10000
+
+# one route driven by the benchmark, path is a string or a function of the
+# request number so the requests can spread over ids or pages
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'headers', 'json', 'data'])
+Scenario.__new__.__defaults__ = ({}, None, None)
+
+
+def add_project(*parts):
+    '''puts a project directory first on sys.path and returns it'''
+    path = os.path.join(PROJECTS_DIR, *parts)
+    sys.path.insert(0, path)
+    return path
+
+
+def scratch_database_url(name):
+    return 'sqlite:///{}'.format(os.path.join(tempfile.mkdtemp(), name + '.db'))
+
+
+def seed(db, table, rows, chunk_size=SEED_CHUNK_SIZE):
+    '''inserts the dicts of rows with one executemany and one commit per chunk'''
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            db.session.execute(table.insert(), chunk)
+            db.session.commit()
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+        count += len(chunk)
+    print('seeded {} rows into {}'.format(count, table.name), file=sys.stderr)
+    return count
+
+
+class SigningKey:
+    '''
+    RSA key signing test tokens. Its public key set is written to a file,
+    the apps verify the tokens against it when JWKS_PATH points to it, so no
+    request reaches Auth0. Needs the cryptography package.
+    '''
+    def __init__(self, kid='benchmark'):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from jose import jwk
+
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = kid
+        self.pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode()
+        public = jwk.construct(self.pem, 'RS256').public_key().to_dict()
+        public.update(kid=kid, use='sig')
+        self.jwks_path = os.path.join(tempfile.mkdtemp(), 'jwks.json')
+        with open(self.jwks_path, 'w') as jwks:
+            json.dump({'keys': [public]}, jwks)
+
+    def token(self, permissions, issuer, audience, ttl=3600):
+        from jose import jwt
+        claims = {
+            'iss': issuer,
+            'aud': audience,
+            'sub': 'benchmark',
+            'exp': int(time.time()) + ttl,
+            'permissions': list(permissions)
+        }
+        return jwt.encode(claims, self.pem, algorithm='RS256', headers={'kid': self.kid})
+
+
+def percentile(samples, q):
+    '''nearest rank percentile of sorted samples'''
+    if not samples:
+        return None
+    rank = max(int(round(q / 100 * len(samples) + 0.5)) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+def summarize(name, durations, errors, seconds):
+    durations = sorted(durations)
+    return {
+        'endpoint': name,
+        'requests': len(durations),
+        'errors': errors,
+        'seconds': round(seconds, 4),
+        'throughput': round(len(durations) / seconds, 1) if seconds else None,
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+        'max_ms': round(durations[-1] * 1000, 3)
+    }
+
+
+def resolve(scenario, number):
+    return scenario.path(number) if callable(scenario.path) else scenario.path
+
+
+def drive_test_client(app, scenario, requests, warmup):
+    '''sends the requests one after the other through the Flask test client'''
+    client = app.test_client()
+    durations = []
+    errors = 0
+    for number in range(-warmup, requests):
+        start = time.perf_counter()
+        response = client.open(resolve(scenario, number), method=scenario.method, headers=scenario.headers,
+                               json=scenario.json, data=scenario.data)
+        # streamed bodies are produced while they are read
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        if number >= 0:
+            durations.append(elapsed)
+            errors += response.status_code >= 400
+    return durations, errors
+
+
+class WSGIServer:
+    '''
+    the application served by werkzeug on a free local port, in a thread.
+    every request gets its own thread, or one of `workers` threads like a
+    gunicorn worker with that many threads.
+    '''
+    def __init__(self, app, workers=None):
+        from concurrent.futures import ThreadPoolExecutor
+        from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args):
+                pass
+
+        class PooledServer(BaseWSGIServer):
+            executor = ThreadPoolExecutor(workers) if workers else None
+
+            def process_request(self, request, client_address):
+                self.executor.submit(self.process_request_thread, request, client_address)
+
+            def process_request_thread(self, request, client_address):
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+
+        if workers:
+            self.server = PooledServer('127.0.0.1', 0, app, handler=QuietHandler)
+        else:
+            self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class ASGIServer:
+    '''the application served by uvicorn on a free local port, one event loop in a thread'''
+    def __init__(self, app):
+        import socket
+        import uvicorn
+
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level='warning', access_log=False, lifespan='on'))
+        self.thread = threading.Thread(target=self.server.run, kwargs={'sockets': [self.socket]}, daemon=True)
+        self.thread.start()
+        while not self.server.started and self.thread.is_alive():
+            time.sleep(0.01)
+
+    def close(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def drive_server(port, scenario, requests, warmup, concurrency):
+    '''sends the requests over HTTP from `concurrency` threads, after the warmup ones'''
+    body = None
+    headers = dict(scenario.headers)
+    if scenario.json is not None:
+        body = json.dumps(scenario.json)
+        headers['Content-Type'] = 'application/json'
+    elif scenario.data is not None:
+        body = scenario.data
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+    def send(number):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        start = time.perf_counter()
+        connection.request(scenario.method, resolve(scenario, number), body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - start
+        connection.close()
+        return elapsed, response.status
+
+    for number in range(-warmup, 0):
+        send(number)
+
+    durations = []
+    errors = [0]
+    lock = threading.Lock()
+    numbers = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                number = next(numbers, None)
+            if number is None:
+                return
+            elapsed, status = send(number)
+            with lock:
+                durations.append(elapsed)
+                errors[0] += status >= 400
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return durations, errors[0], time.perf_counter() - start
+
+
+def run(app, scenarios, requests, warmup=10, wsgi=False, concurrency=1, workers=None, asgi=False):
+    '''
+    drives every scenario and returns one summary per endpoint, through the
+    test client, or over HTTP with wsgi (a Flask app) or asgi (an ASGI app)
+    '''
+    server = ASGIServer(app) if asgi else WSGIServer(app, workers) if wsgi else None
+    results = []
+    try:
+        for scenario in scenarios:
+            if server is None:
+                durations, errors = drive_test_client(app, scenario, requests, warmup)
+                seconds = sum(durations)
+            else:
+                durations, errors, seconds = drive_server(server.port, scenario, requests, warmup, concurrency)
+            results.append(summarize(scenario.name, durations, errors, seconds))
+            print_result(results[-1])
+    finally:
+        if server is not None:
+            server.close()
+    return results
+
+
+def print_result(result):
+    print('{endpoint:<48} {throughput:>9} req/s  p50 {p50_ms:>8.2f}  p95 {p95_ms:>8.2f}  '
+          'p99 {p99_ms:>8.2f} ms  errors {errors}'.format(**result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(path, project, settings, results):
+    '''writes the results and the conditions they were measured in'''
+    document = {
+        'project': project,
+        'commit': git_commit(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': settings,
+        'results': results
+    }
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2)
+
+
+def compare(path, settings, results):
+    '''prints the change of throughput and p95 against a saved result file'''
+    with open(path) as previous_file:
+        previous = json.load(previous_file)
+    before = {result['endpoint']: result for result in previous['results']}
+    print('\ncompared to {} ({})'.format(path, (previous.get('commit') or 'unknown commit')[:12]))
+    if previous.get('settings') != settings:
+        print('measured with other settings: {}'.format(previous.get('settings')))
+    for result in results:
+        old = before.get(result['endpoint'])
+        if old is None or not old['throughput'] or not old['p95_ms']:
+            continue
+        print('{:<48} throughput {:>+7.1f}%  p95 {:>+7.1f}%'.format(
+            result['endpoint'],
+            (result['throughput'] / old['throughput'] - 1) * 100,
+            (result['p95_ms'] / old['p95_ms'] - 1) * 100))
@@ -0,0 +1,231 @@
+'''
+Load test of the read routes of one project: seeds synthetic rows at the
+given scale, drives every route with the Flask test client (or over HTTP with
+--wsgi) and reports the throughput and the p50/p95/p99 latency per endpoint.
+
+    fyyur     --scale venues, a tenth as many artists and one show per venue
+              (PostgreSQL only, the genres are ARRAY columns)
+    trivia    --scale questions in 6 categories
+    coffee    --scale drinks
+    capstone  --scale movies and actors, 3 actors per movie
+
+Runs against a scratch sqlite file by default. Pass --database-url for a
+PostgreSQL database, and --no-seed to reuse rows seeded by an earlier run.
+The routes requiring a token get one signed by a key generated for the run,
+JWKS_PATH points the app to its public key set. --output saves the results
+as JSON, --compare prints the change against a saved file.
+
+    python benchmarks/load.py trivia --scale 100000
+    python benchmarks/load.py capstone --wsgi --concurrency 8 --output capstone.json
+    python benchmarks/load.py capstone --wsgi --concurrency 8 --compare capstone.json
+'''
+import argparse
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+
+from harness import Scenario, SigningKey, add_project, compare, run, save, scratch_database_url, seed
+
+GENRES = ['Jazz', 'Reggae', 'Swing', 'Classical', 'Folk', 'Rock n Roll', 'Hip-Hop', 'Blues']
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL'),
+          ('Boston', 'MA'), ('Denver', 'CO'), ('Miami', 'FL'), ('Portland', 'OR'), ('Atlanta', 'GA')]
+
+
+def ids(count):
+    '''a function spreading the requests over the ids 1..count'''
+    generator = random.Random(0)
+    return lambda number: generator.randint(1, max(count, 1))
+
+
+def fyyur(args, key):
+    add_project('01_fyyur', 'starter_code')
+    import app as fyyur_app
+    from models import db, Venue, Artist, Show
+
+    app = fyyur_app.app
+    # the engine is created on first use, the configured database is not touched
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['WTF_CSRF_ENABLED'] = False
+    artists = max(args.scale // 10, 1)
+    if args.seed:
+        with app.app_context():
+            db.create_all()
+            seed(db, Venue.__table__, ({
+                'name': 'Venue {}'.format(number),
+                'city': CITIES[number % len(CITIES)][0],
+                'state': CITIES[number % len(CITIES)][1],
+                'address': '{} Main Street'.format(number),
+                'phone': '555-000-{:04d}'.format(number % 10000),
+                'genres': GENRES[number % 3:number % 3 + 2],
+                'seeking_talent': number % 2 == 0
+            } for number in range(args.scale)))
+            seed(db, Artist.__table__, ({
+                'name': 'Artist {}'.format(number),
+                'city': CITIES[number % len(CITIES)][0],
+                'state': CITIES[number % len(CITIES)][1],
+                'genres': GENRES[number % 5:number % 5 + 1],
+                'seeking_venue': number % 3 == 0
+            } for number in range(artists)))
+            now = datetime.utcnow()
+            seed(db, Show.__table__, ({
+                'venue_id': number + 1,
+                'artist_id': number % artists + 1,
+                'start_time': now + timedelta(days=number % 60 - 30)
+            } for number in range(args.scale)))
+
+    return app, [
+        Scenario('GET /venues?page', 'GET', '/venues?page=1'),
+        Scenario('GET /venues/<id>', 'GET', lambda number, venue=ids(args.scale): '/venues/{}'.format(venue(number))),
+        Scenario('POST /venues/search', 'POST', '/venues/search', data='search_term=Venue 1'),
+        Scenario('GET /artists', 'GET', '/artists'),
+        Scenario('GET /artists/<id>', 'GET', lambda number, artist=ids(artists): '/artists/{}'.format(artist(number))),
+        Scenario('POST /artists/search', 'POST', '/artists/search', data='search_term=Artist 1'),
+        Scenario('GET /shows', 'GET', '/shows'),
+    ]
+
+
+def trivia(args, key):
+    add_project('02_trivia_api', 'starter', 'backend')
+    from flaskr import create_app
+    from models import setup_db, db, Question, Category
+
+    app = create_app()
+    setup_db(app, args.database_url)
+    if args.seed:
+        with app.app_context():
+            db.create_all()
+            seed(db, Category.__table__, ({'id': number, 'type': 'Category {}'.format(number)} for number in range(1, 7)))
+            seed(db, Question.__table__, ({
+                'question': 'Benchmark question {}'.format(number),
+                'answer': 'Answer {}'.format(number),
+                'category': number % 6 + 1,
+                'difficulty': number % 5 + 1
+            } for number in range(args.scale)))
+
+    pages = max(args.scale // 10, 1)
+    return app, [
+        Scenario('GET /api/v1/categories', 'GET', '/api/v1/categories'),
+        Scenario('GET /api/v1/questions?page', 'GET', lambda number, page=ids(pages): '/api/v1/questions?page={}'.format(page(number))),
+        Scenario('GET /api/v1/questions?cursor', 'GET', '/api/v1/questions?cursor='),
+        Scenario('GET /api/v1/categories/<id>/questions', 'GET', lambda number: '/api/v1/categories/{}/questions'.format(number % 6 + 1)),
+        Scenario('POST /api/v1/questions/search', 'POST', '/api/v1/questions/search', json={'searchTerm': 'question 1'}),
+        Scenario('POST /api/v1/quizzes', 'POST', '/api/v1/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 1}}),
+    ]
+
+
+def coffee(args, key):
+    add_project('03_coffee_shop_full_stack', 'starter_code', 'backend')
+    from src.database import models
+    # the checked in database must not be touched, point the app to another one before it is created
+    models.database_path = args.database_url
+    from src.api import app
+
+    if args.seed:
+        with app.app_context():
+            models.db.create_all()
+            seed(models.db, models.Drink.__table__, ({
+                'title': 'drink {}'.format(number),
+                'recipe': json.dumps([{'name': 'ingredient {}'.format(part), 'color': '#6f4e37', 'parts': part + 1}
+                                      for part in range(number % 3 + 1)])
+            } for number in range(args.scale)))
+
+    token = key.token(['get:drinks-detail'], issuer='https://a-djedaini.auth0.com/', audience='fsnd')
+    return app, [
+        Scenario('GET /drinks', 'GET', '/drinks'),
+        Scenario('GET /drinks (gzip)', 'GET', '/drinks', headers={'Accept-Encoding': 'gzip'}),
+        Scenario('GET /drinks-detail', 'GET', '/drinks-detail', headers={'Authorization': 'Bearer ' + token}),
+    ]
+
+
+def capstone(args, key):
+    add_project('capstone', 'starter')
+    os.environ.update({
+        'DATABASE_URL': args.database_url,
+        'AUTH0_DOMAIN': 'benchmark.test',
+        'API_AUDIENCE': 'benchmark',
+        'ALGORITHMS': 'RS256'
+    })
+    from app import create_app
+    from models import db, Movie, Actor, actors_movies
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url})
+    if args.seed:
+        with app.app_context():
+            db.create_all()
+            seed(db, Movie.__table__, ({
+                'title': 'Movie {}'.format(number),
+                'release_date': date(1950 + number % 70, number % 12 + 1, number % 28 + 1)
+            } for number in range(args.scale)))
+            seed(db, Actor.__table__, ({
+                'name': 'Actor {}'.format(number),
+                'age': 18 + number % 60,
+                'gender': 'female' if number % 2 else 'male'
+            } for number in range(args.scale)))
+            seed(db, actors_movies, ({
+                'movie_id': number // 3 + 1,
+                'actor_id': (number // 3 + number % 3) % args.scale + 1
+            } for number in range(args.scale * 3 if args.scale >= 3 else 0)))
+
+    headers = {'Authorization': 'Bearer ' + key.token(['view:movies', 'view:actors'], issuer='https://benchmark.test/',
+                                                        audience='benchmark')}
+    pages = max(args.scale // 10, 1)
+    return app, [
+        Scenario('GET /api/v1/movies?page', 'GET', lambda number, page=ids(pages): '/api/v1/movies?page={}'.format(page(number)),
+                 headers=headers),
+        Scenario('GET /api/v1/movies?include=actors', 'GET', '/api/v1/movies?include=actors', headers=headers),
+        Scenario('GET /api/v1/movies?released_after&sort', 'GET',
+                 '/api/v1/movies?released_after=2000-01-01&sort=-release_date', headers=headers),
+        Scenario('GET /api/v1/movies/<id>/actors', 'GET',
+                 lambda number, movie=ids(args.scale): '/api/v1/movies/{}/actors'.format(movie(number)), headers=headers),
+        Scenario('GET /api/v1/actors?page', 'GET', lambda number, page=ids(pages): '/api/v1/actors?page={}'.format(page(number)),
+                 headers=headers),
+        Scenario('GET /api/v1/actors/<id>/movies', 'GET',
+                 lambda number, actor=ids(args.scale): '/api/v1/actors/{}/movies'.format(actor(number)), headers=headers),
+    ]
+
+
+PROJECTS = {'fyyur': fyyur, 'trivia': trivia, 'coffee': coffee, 'capstone': capstone}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('project', choices=sorted(PROJECTS))
+    parser.add_argument('--scale', type=int, default=10000, help='rows of the main table')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per endpoint')
+    parser.add_argument('--database-url')
+    parser.add_argument('--no-seed', dest='seed', action='store_false', help='use the rows already in the database')
+    parser.add_argument('--only', help='only the endpoints whose name contains this text')
+    parser.add_argument('--wsgi', action='store_true', help='serve the app on a local port and send real HTTP requests')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads with --wsgi')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+    if args.project == 'fyyur' and not args.database_url:
+        parser.error('fyyur needs a PostgreSQL --database-url')
+    args.database_url = args.database_url or scratch_database_url(args.project)
+
+    key = SigningKey()
+    # read when the auth modules are imported
+    os.environ['JWKS_PATH'] = key.jwks_path
+    app, scenarios = PROJECTS[args.project](args, key)
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if args.only in scenario.name]
+
+    results = run(app, scenarios, args.requests, args.warmup, args.wsgi, args.concurrency)
+    settings = {
+        'scale': args.scale,
+        'requests': args.requests,
+        'database': args.database_url.split(':', 1)[0],
+        'wsgi': args.wsgi,
+        'concurrency': args.concurrency if args.wsgi else 1
+    }
+    if args.output:
+        save(args.output, args.project, settings, results)
+    if args.compare:
+        compare(args.compare, settings, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Smoke run of every benchmark: each script runs once in a fresh interpreter
+with the smallest settings, against scratch sqlite files, so a change to the
+startup or the models of a project cannot silently break them. Exits with
+status 1 when a script fails, or when a load test answers an error.
+
+The fyyur load test needs PostgreSQL, it runs only with --fyyur-database-url.
+
+    python benchmarks/smoke.py
+    python benchmarks/smoke.py --fyyur-database-url postgresql://localhost/fyyur_bench
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (script, arguments) of the runs, the smallest settings each script accepts
+RUNS = [
+    ('trivia_quiz.py', ['--sizes', '1000', '--picks', '10', '--baseline-picks', '2']),
+    ('trivia_inserts.py', ['--rows', '20', '--batch', '5']),
+    ('coffee_drinks.py', ['--drinks', '100', '--requests', '3']),
+    ('startup.py', ['--repeat', '1']),
+    ('load.py', ['trivia', '--scale', '100', '--requests', '3', '--warmup', '1']),
+    ('load.py', ['coffee', '--scale', '100', '--requests', '3', '--warmup', '1']),
+    ('load.py', ['capstone', '--scale', '100', '--requests', '3', '--warmup', '1']),
+    ('trivia_asgi.py', ['--scale', '100', '--requests', '3', '--warmup', '1', '--clients', '1,2', '--workers', '1']),
+]
+
+
+def load_errors(path):
+    '''the endpoints of a load.py result file which answered an error'''
+    with open(path) as result_file:
+        results = json.load(result_file)['results']
+    return [result['endpoint'] for result in results if result['errors']]
+
+
+def smoke(script, arguments):
+    '''runs script and returns the reason it failed, None when it passed'''
+    output_path = None
+    if script == 'load.py':
+        output_path = os.path.join(tempfile.mkdtemp(), 'load.json')
+        arguments = arguments + ['--output', output_path]
+    completed = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, script)] + arguments,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    if completed.returncode:
+        lines = completed.stderr.decode(errors='replace').strip().splitlines()
+        return lines[-3:] or ['exit status {}'.format(completed.returncode)]
+    if output_path is not None:
+        failed = load_errors(output_path)
+        if failed:
+            return ['errors on ' + ', '.join(failed)]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fyyur-database-url')
+    args = parser.parse_args()
+
+    runs = list(RUNS)
+    if args.fyyur_database_url:
+        runs.append(('load.py', ['fyyur', '--scale', '100', '--requests', '3', '--warmup', '1',
+                                 '--database-url', args.fyyur_database_url]))
+
+    failures = 0
+    for script, arguments in runs:
+        name = ' '.join([script] + arguments[:1] if script == 'load.py' else [script])
+        start = time.perf_counter()
+        failure = smoke(script, arguments)
+        elapsed = time.perf_counter() - start
+        print('{:<22} {:<6} {:>7.1f}s'.format(name, 'FAILED' if failure else 'ok', elapsed))
+        for line in failure or []:
+            print('    ' + line)
+        failures += failure is not None
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+Startup time of every application, the work a gunicorn worker does before
+it serves its first request.
+
+Each run imports the application in a fresh interpreter and builds it, and
+counts the SQL statements sent meanwhile: starting a worker must not touch
+the database, the tables are created by the `flask create-db` command or the
+migrations. The table shows the median of the runs.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 20 --app trivia
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'projects')
+
+# (directory, statement building the application)
+APPS = {
+    'trivia': ('02_trivia_api/starter/backend', 'from flaskr import create_app; create_app()'),
+    'coffee': ('03_coffee_shop_full_stack/starter_code/backend', 'import src.api'),
+    'capstone': ('capstone/starter', 'from app import create_app; create_app()'),
+    'heroku_sample': ('capstone/heroku_sample/starter', 'import app'),
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+sys.path.insert(0, '.')
+{}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'statements': statements}}))
+'''
+
+
+def run(directory, statement, environ):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(statement)],
+        cwd=os.path.join(PROJECTS_DIR, directory),
+        env=environ,
+        stdout=subprocess.PIPE,
+        check=True
+    ).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--app', choices=sorted(APPS), action='append')
+    args = parser.parse_args()
+
+    environ = dict(os.environ)
+    environ.setdefault('DATABASE_URL', 'sqlite:///{}'.format(os.path.join(tempfile.mkdtemp(), 'startup.db')))
+
+    print('{:>14} {:>10} {:>11}'.format('app', 'ms', 'statements'))
+    for name in args.app or APPS:
+        directory, statement = APPS[name]
+        runs = [run(directory, statement, environ) for _ in range(args.repeat)]
+        milliseconds = statistics.median(result['seconds'] for result in runs) * 1000
+        statements = max(len(result['statements']) for result in runs)
+        print('{:>14} {:>10.1f} {:>11}'.format(name, milliseconds, statements))
+        for sql in runs[0]['statements']:
+            print('    ' + sql.strip().splitlines()[0])
+
+
+if __name__ == '__main__':
+    main()
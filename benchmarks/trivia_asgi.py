@@ -0,0 +1,61 @@
+'''
+Throughput of the trivia API served synchronously (the Flask app on a
+werkzeug server with --workers threads, one request per thread) against the
+Starlette app of flaskr/asgi.py (one uvicorn event loop), as the number of
+concurrent clients grows.
+
+Every client sends its next request as soon as the previous one answered.
+With PostgreSQL (--database-url, needs asyncpg) the sync server queues the
+requests beyond its threads while they wait on the database, the event loop
+keeps serving them. SQLite answers in microseconds and its async driver runs
+queries in a thread, expect little difference there.
+
+    python benchmarks/trivia_asgi.py --clients 1,16,64 --workers 4
+    python benchmarks/trivia_asgi.py --database-url postgresql://localhost/trivia_bench --no-seed
+'''
+import argparse
+from types import SimpleNamespace
+
+from harness import run, scratch_database_url
+from load import trivia
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10000, help='questions')
+    parser.add_argument('--requests', type=int, default=500, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests per endpoint')
+    parser.add_argument('--clients', default='1,16,64', help='comma separated numbers of concurrent clients')
+    parser.add_argument('--workers', type=int, default=4, help='threads of the sync server')
+    parser.add_argument('--database-url')
+    parser.add_argument('--no-seed', dest='seed', action='store_false', help='use the rows already in the database')
+    parser.add_argument('--only', help='only the endpoints whose name contains this text')
+    args = parser.parse_args()
+    database_url = args.database_url or scratch_database_url('trivia')
+
+    flask_app, scenarios = trivia(SimpleNamespace(scale=args.scale, seed=args.seed, database_url=database_url), None)
+    from flaskr.asgi import create_app
+    asgi_app = create_app(database_url)
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if args.only in scenario.name]
+
+    totals = []
+    for clients in [int(clients) for clients in args.clients.split(',')]:
+        for server, app, options in (
+            ('wsgi x{}'.format(args.workers), flask_app, {'wsgi': True, 'workers': args.workers}),
+            ('asgi', asgi_app, {'asgi': True})
+        ):
+            print('\n{} clients, {}'.format(clients, server))
+            results = run(app, scenarios, args.requests, args.warmup, concurrency=clients, **options)
+            requests = sum(result['requests'] for result in results)
+            seconds = sum(result['seconds'] for result in results)
+            totals.append((clients, server, requests / seconds, max(result['p99_ms'] for result in results),
+                           sum(result['errors'] for result in results)))
+
+    print('\n{:>8} {:<10} {:>10} {:>14} {:>7}'.format('clients', 'server', 'req/s', 'worst p99 ms', 'errors'))
+    for clients, server, throughput, p99, errors in totals:
+        print('{:>8} {:<10} {:>10.1f} {:>14.2f} {:>7}'.format(clients, server, throughput, p99, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+Inserts per second of trivia questions, per commit strategy.
+
+    per-call      Question.insert() commits every row
+    unit-of-work  the inserts of a batch share one unit_of_work() commit
+    write-behind  rows are queued to the WriteBehind thread, which inserts
+                  them with one executemany and one commit per batch
+
+Runs against a scratch sqlite file by default, pass --database-url to
+measure a PostgreSQL database (its questions table gets the rows).
+
+    python benchmarks/trivia_inserts.py
+    python benchmarks/trivia_inserts.py --rows 5000 --batch 100
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'projects',
+                           '02_trivia_api', 'starter', 'backend')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=50, help='inserts per unit of work')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from flask import Flask
+    from models import setup_db, db, unit_of_work, Question, Category
+    from flaskr.write_behind import WriteBehind
+
+    app = Flask(__name__)
+    setup_db(app, args.database_url or 'sqlite:///{}'.format(os.path.join(tempfile.mkdtemp(), 'trivia.db')))
+    with app.app_context():
+        if not args.database_url:
+            # setup_db() leaves the schema to the create-db command
+            db.create_all()
+        category = Category('Benchmark')
+        db.session.add(category)
+        db.session.commit()
+        category_id = category.id
+
+    def values(number):
+        return {'question': 'benchmark question %d' % number, 'answer': 'a', 'category': category_id, 'difficulty': 1}
+
+    def per_call():
+        for number in range(args.rows):
+            Question(**values(number)).insert()
+
+    def batched():
+        for start in range(0, args.rows, args.batch):
+            with unit_of_work():
+                for number in range(start, min(start + args.batch, args.rows)):
+                    Question(**values(number)).insert()
+
+    writer = WriteBehind(app, db, Question.__table__)
+
+    def write_behind():
+        for number in range(args.rows):
+            writer.add(values(number))
+        writer.flush()
+
+    print('{:>14} {:>10} {:>12}'.format('strategy', 'seconds', 'inserts/s'))
+    for name, run in (('per-call', per_call), ('unit-of-work', batched), ('write-behind', write_behind)):
+        with app.app_context():
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            db.session.remove()
+        print('{:>14} {:>10.2f} {:>12.0f}'.format(name, elapsed, args.rows / elapsed))
+
+    with app.app_context():
+        Question.query.filter(Question.category == category_id).delete()
+        Category.query.filter(Category.id == category_id).delete()
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
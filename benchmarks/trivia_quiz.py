@@ -0,0 +1,81 @@
+'''
+Latency of picking the next quiz question as the question bank grows.
+
+Compares the QuizEngine of the trivia backend (random draws in an in-memory
+id index) with the previous approach (format every question of the category,
+drop the previous ones and choose one). No database is needed, the question
+bank is generated in memory.
+
+    python benchmarks/trivia_quiz.py
+    python benchmarks/trivia_quiz.py --sizes 1000 100000 1000000 --picks 2000
+'''
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import time
+
+QUIZ_PATH = os.path.join(os.path.dirname(__file__), '..', 'projects', '02_trivia_api',
+                         'starter', 'backend', 'flaskr', 'quiz.py')
+CATEGORIES = 6
+PREVIOUS_QUESTIONS = 20
+
+
+def load_quiz_module():
+    # loaded by path, importing the flaskr package would need a database
+    spec = importlib.util.spec_from_file_location('quiz', QUIZ_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def question_bank(size):
+    return [(question_id % CATEGORIES + 1, question_id) for question_id in range(1, size + 1)]
+
+
+def format_all_pick(questions, category, previous):
+    formatted = [{'id': question_id, 'category': question_category}
+                 for question_category, question_id in questions
+                 if question_category == category and question_id not in previous]
+    return random.choice(formatted) if formatted else None
+
+
+def measure(pick, picks):
+    timings = []
+    for _ in range(picks):
+        start = time.perf_counter()
+        pick()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return statistics.median(timings) * 1e6, timings[int(len(timings) * 0.99) - 1] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--picks', type=int, default=1000)
+    parser.add_argument('--baseline-picks', type=int, default=20,
+                        help='picks measured for the previous approach, which is slow on large banks')
+    args = parser.parse_args()
+
+    quiz = load_quiz_module()
+    print('{:>10} {:>14} {:>14} {:>14} {:>14} {:>12}'.format(
+        'questions', 'engine p50 us', 'engine p99 us', 'before p50 us', 'before p99 us', 'index load s'))
+    for size in args.sizes:
+        questions = question_bank(size)
+        engine = quiz.QuizEngine(lambda: questions)
+        start = time.perf_counter()
+        engine.ids()
+        load_time = time.perf_counter() - start
+
+        previous = set(random.sample(range(1, size + 1), min(PREVIOUS_QUESTIONS, size)))
+        category = random.randint(1, CATEGORIES)
+        engine_p50, engine_p99 = measure(lambda: engine.pick(category, previous), args.picks)
+        before_p50, before_p99 = measure(lambda: format_all_pick(questions, category, previous), args.baseline_picks)
+        print('{:>10} {:>14.1f} {:>14.1f} {:>14.1f} {:>14.1f} {:>12.3f}'.format(
+            size, engine_p50, engine_p99, before_p50, before_p99, load_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+'''
+Auth0 token helpers shared by the Flask projects of this repository,
+installed with fsnd_db by `pip install -e lib`. They need the jose package
+(python-jose or python-jose-cryptodome) of the project requirements.
+
+    fsnd_auth.jwks        JWKSCache, the signing keys of the issuer fetched
+                          once per process, and verify_signature
+    fsnd_auth.token_cache TokenCache, a bounded LRU cache of verified
+                          token payloads
+'''
+from .jwks import JWKSCache, verify_signature
+from .token_cache import TokenCache
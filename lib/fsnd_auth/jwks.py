@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+from jose import jwk
+from jose.utils import base64url_decode
+
+
+'''
+JWKSCache
+    process-wide store of the signing keys published in a JWKS document
+
+    the key set is parsed once into RSA key objects indexed by kid.
+    the whole set is fetched again once it is older than `ttl` seconds,
+    and an unknown kid triggers at most one fetch every
+    `min_refresh_interval` seconds so tokens carrying made up key ids
+    can not flood the issuer with requests.
+    when `path` is given the key set is read from that local file instead
+    of `url`, which allows verifying tokens offline.
+'''
+
+
+class JWKSCache:
+    def __init__(
+        self,
+        url=None,
+        path=None,
+        ttl=600,
+        min_refresh_interval=30,
+        timeout=5
+    ):
+        if url is None and path is None:
+            raise ValueError('JWKSCache needs either a url or a path.')
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._expires_at = 0
+        self._last_fetch = None
+        self._lock = threading.Lock()
+
+    '''
+    get_key(kid)
+        returns the key object for kid
+        or None when the issuer does not know it
+    '''
+
+    def get_key(self, kid):
+        keys = self._keys
+        if kid in keys and time.monotonic() < self._expires_at:
+            return keys[kid]
+
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires_at or (
+                kid not in self._keys and self._may_fetch(now)
+            ):
+                self._refresh(now)
+            return self._keys.get(kid)
+
+    '''
+    load(jwks)
+        replaces the cached keys with the ones of a decoded JWKS document
+    '''
+
+    def load(self, jwks, now=None):
+        keys = {}
+        for key in jwks.get('keys', []):
+            if 'kid' not in key or key.get('kty') != 'RSA'\
+                    or key.get('use', 'sig') != 'sig':
+                continue
+            try:
+                keys[key['kid']] = jwk.construct(key, key.get('alg', 'RS256'))
+            except Exception:
+                continue
+        self._keys = keys
+        if now is None:
+            now = time.monotonic()
+        self._expires_at = now + self.ttl
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0
+            self._last_fetch = None
+
+    def _may_fetch(self, now):
+        return self._last_fetch is None\
+            or now - self._last_fetch >= self.min_refresh_interval
+
+    def _refresh(self, now):
+        self._last_fetch = now
+        try:
+            jwks = self._fetch()
+        except Exception:
+            # keep serving the keys we already have and back off,
+            # a failing issuer should not be hit on every request
+            if not self._keys:
+                raise
+            self._expires_at = now + self.min_refresh_interval
+            return
+        self.load(jwks, now)
+
+    def _fetch(self):
+        if self.path is not None:
+            with open(self.path) as jwks_file:
+                return json.load(jwks_file)
+        with urlopen(self.url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+'''
+verify_signature(token, key)
+    checks the signature of a compact serialized token against a key object
+    returns True if the signature matches
+'''
+
+
+def verify_signature(token, key):
+    signing_input, _, signature = token.rpartition('.')
+    return key.verify(
+        signing_input.encode('utf-8'),
+        base64url_decode(signature.encode('utf-8'))
+    )
@@ -0,0 +1,79 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+TokenCache
+    bounded LRU cache of verified jwt payloads
+
+    entries are keyed by the sha256 digest of the raw token so the tokens
+    themselves are never kept in memory, and each entry expires at the exp
+    claim of its token. tokens without an exp claim are never cached.
+    hits and misses are counted so the saved verifications can be observed.
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    '''
+    get(token)
+        returns the cached payload of token or None
+    '''
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    '''
+    set(token, payload)
+        caches the verified payload of token until its exp claim
+    '''
+
+    def set(self, token, payload):
+        expires_at = payload.get('exp')
+        if self.maxsize <= 0 or not isinstance(expires_at, (int, float))\
+                or expires_at <= time.time():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
@@ -0,0 +1,15 @@
+'''
+Database helpers shared by the Flask projects of this repository, install
+them in the virtual environment of a project with `pip install -e lib`
+(the requirements files of the projects do it).
+
+    fsnd_db.engine  connection pool settings read from the environment and
+                    pool counters
+    fsnd_db.routing RoutingSQLAlchemy, sending the queries of read only
+                    requests to replicas
+    fsnd_db.metrics RequestMetrics, request latency and SQL counters served
+                    on /metrics in the Prometheus text format
+'''
+from .engine import engine_options, pool_stats, pool_metrics
+from .routing import RoutingSQLAlchemy
+from .metrics import RequestMetrics
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+'''
+PoolMetrics
+    connection pool counters of the process
+        checkouts: connections handed out by the pool
+        checkout_seconds_total / checkout_seconds_max: time spent waiting
+            for a connection, a growing wait means the pool is starved
+        overflow_events: checkouts which left more than pool_size
+            connections checked out
+        timeouts: checkouts which gave up after pool_timeout
+        connections_opened: database connections opened by the pool
+'''
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.slow_checkout_seconds = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds, overflowed):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds_total += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+            if overflowed:
+                self.overflow_events += 1
+        if self.slow_checkout_seconds is not None\
+                and seconds >= self.slow_checkout_seconds:
+            logger.warning('waited %.3fs for a database connection', seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+'''
+InstrumentedQueuePool
+    QueuePool timing every checkout into pool_metrics
+    the wait is measured around the public checkout methods, connect()
+    (SQLAlchemy 1.4+ engines) and unique_connection() (1.3 engines), the
+    overflow is read from checkedout() and size(), and the connections
+    opened are counted by the `connect` pool event
+'''
+
+
+class InstrumentedQueuePool(QueuePool):
+    metrics = pool_metrics
+
+    def connect(self):
+        return self.timed_checkout(super().connect)
+
+    def unique_connection(self):
+        return self.timed_checkout(super().unique_connection)
+
+    def timed_checkout(self, checkout):
+        start = time.perf_counter()
+        try:
+            connection = checkout()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record(
+            time.perf_counter() - start,
+            self.checkedout() > self.size()
+        )
+        return connection
+
+
+@event.listens_for(InstrumentedQueuePool, 'connect')
+def count_connection(dbapi_connection, connection_record):
+    InstrumentedQueuePool.metrics.record_connect()
+
+
+'''
+engine_options(database_path)
+    SQLALCHEMY_ENGINE_OPTIONS of database_path read from the environment
+        DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30 seconds)
+        DB_POOL_RECYCLE (1800 seconds), DB_POOL_PRE_PING (true)
+        DB_STATEMENT_TIMEOUT_MS (PostgreSQL only, unset by default)
+        DB_POOL_SLOW_CHECKOUT_MS (unset): log checkouts slower than this
+    size the pool so that workers * (pool_size + max_overflow) stays below
+    the max_connections of the database
+    sqlite databases keep the default pool of their driver
+'''
+
+
+def engine_options(database_path, environ=os.environ):
+    slow_checkout = environ.get('DB_POOL_SLOW_CHECKOUT_MS')
+    pool_metrics.slow_checkout_seconds =\
+        int(slow_checkout) / 1000 if slow_checkout else None
+
+    options = {
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true') == 'true'
+    }
+    if database_path.startswith('sqlite'):
+        return options
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800))
+    })
+    statement_timeout = environ.get('DB_STATEMENT_TIMEOUT_MS')
+    if statement_timeout and database_path.startswith('postgres'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(int(statement_timeout))
+        }
+    return options
+
+
+'''
+pool_stats(engine)
+    pool_metrics counters and the current state of the pool of engine
+'''
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {
+        'checkouts': pool_metrics.checkouts,
+        'checkout_seconds_total': pool_metrics.checkout_seconds_total,
+        'checkout_seconds_max': pool_metrics.checkout_seconds_max,
+        'overflow_events': pool_metrics.overflow_events,
+        'timeouts': pool_metrics.timeouts,
+        'connections_opened': pool_metrics.connections_opened
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'pool_size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0)
+        })
+    return stats
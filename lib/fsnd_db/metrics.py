@@ -0,0 +1,254 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from flask import abort, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+'''
+RequestMetrics
+    records the latency of every request in a histogram per endpoint,
+    and the SQL statements it sent, the time spent in the database and
+    the rows returned by queries (as reported by the driver, SQLite
+    reports none)
+    a request sending the same statement METRICS_N_PLUS_ONE_THRESHOLD
+    (10) times or more is counted and logged as an N+1 query pattern
+    the metrics are served in the Prometheus text format on /metrics,
+    to local clients only
+    pool_stats() returns the counters of the connection pool, see
+    fsnd_db.engine.pool_stats()
+'''
+
+
+class RequestMetrics:
+    def __init__(self, app=None, pool_stats=None):
+        self.pool_stats = pool_stats
+        self.n_plus_one_threshold = 10
+        self._latency = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.n_plus_one_threshold = app.config.setdefault(
+            'METRICS_N_PLUS_ONE_THRESHOLD',
+            int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 10))
+        )
+        listen_to_statements()
+        app.before_request(self._start)
+        app.after_request(self._record)
+        app.add_url_rule('/metrics', 'metrics', self._serve)
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+        g.request_sql = RequestSQL()
+
+    def _record(self, response):
+        started = g.pop('request_started', None)
+        sql = g.pop('request_sql', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+        endpoint = request.endpoint or 'unknown'
+        statement, repeats = sql.most_repeated()
+        n_plus_one = repeats >= self.n_plus_one_threshold
+        if n_plus_one:
+            logger.warning(
+                '%s sent %d times: %s',
+                endpoint, repeats, statement.strip().splitlines()[0]
+            )
+        self.observe(
+            endpoint,
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            sql,
+            n_plus_one
+        )
+        return response
+
+    def observe(self, endpoint, method, status, seconds, sql, n_plus_one):
+        key = (endpoint, method)
+        with self._lock:
+            histogram = self._latency.setdefault(
+                key,
+                [0] * len(LATENCY_BUCKETS) + [0, 0.0]
+            )
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+            counters = self._counters
+            for name, value in (
+                (('http_requests_total', endpoint, method, str(status)), 1),
+                (('http_request_sql_statements_total', endpoint),
+                 sql.statements),
+                (('http_request_sql_seconds_total', endpoint), sql.seconds),
+                (('http_request_sql_rows_total', endpoint), sql.rows),
+                (('http_request_n_plus_one_total', endpoint), int(n_plus_one))
+            ):
+                counters[name] = counters.get(name, 0) + value
+
+    def render(self):
+        with self._lock:
+            latency = {k: list(v) for k, v in self._latency.items()}
+            counters = dict(self._counters)
+
+        lines = [
+            '# HELP http_request_duration_seconds Request latency.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for (endpoint, method), histogram in sorted(latency.items()):
+            labels = 'endpoint="{}",method="{}"'.format(
+                escape(endpoint), method
+            )
+            bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+            for bound, count in zip(bounds, histogram[:-2] + [histogram[-2]]):
+                lines.append(
+                    'http_request_duration_seconds_bucket{{{},le="{}"}} {}'
+                    .format(labels, bound, count)
+                )
+            lines += [
+                'http_request_duration_seconds_sum{{{}}} {}'
+                .format(labels, histogram[-1]),
+                'http_request_duration_seconds_count{{{}}} {}'
+                .format(labels, histogram[-2])
+            ]
+
+        for name, help_text, label_names in COUNTERS:
+            lines += [
+                '# HELP {} {}'.format(name, help_text),
+                '# TYPE {} counter'.format(name)
+            ]
+            for key, value in sorted(counters.items()):
+                if key[0] == name:
+                    labels = ','.join(
+                        '{}="{}"'.format(label, escape(label_value))
+                        for label, label_value in zip(label_names, key[1:])
+                    )
+                    lines.append('{}{{{}}} {}'.format(name, labels, value))
+
+        if self.pool_stats is not None:
+            for key, value in sorted(self.pool_stats().items()):
+                if key in POOL_METRICS:
+                    name, kind = POOL_METRICS[key]
+                    lines += [
+                        '# TYPE {} {}'.format(name, kind),
+                        '{} {}'.format(name, value)
+                    ]
+        return '\n'.join(lines) + '\n'
+
+    def _serve(self):
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            abort(404)
+        return self.render(), 200, {
+            'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+        }
+
+
+COUNTERS = (
+    ('http_requests_total', 'Requests by status.',
+     ('endpoint', 'method', 'status')),
+    ('http_request_sql_statements_total', 'SQL statements sent.',
+     ('endpoint',)),
+    ('http_request_sql_seconds_total', 'Time spent executing SQL.',
+     ('endpoint',)),
+    ('http_request_sql_rows_total', 'Rows returned by SQL statements.',
+     ('endpoint',)),
+    ('http_request_n_plus_one_total', 'Requests repeating a statement.',
+     ('endpoint',))
+)
+
+# fsnd_db.engine.pool_stats() keys
+POOL_METRICS = {
+    'checkouts': ('db_pool_checkouts_total', 'counter'),
+    'checkout_seconds_total': ('db_pool_checkout_seconds_total', 'counter'),
+    'checkout_seconds_max': ('db_pool_checkout_seconds_max', 'gauge'),
+    'overflow_events': ('db_pool_overflow_events_total', 'counter'),
+    'timeouts': ('db_pool_timeouts_total', 'counter'),
+    'connections_opened': ('db_pool_connections_opened_total', 'counter'),
+    'pool_size': ('db_pool_size', 'gauge'),
+    'checked_out': ('db_pool_checked_out', 'gauge'),
+    'overflow': ('db_pool_overflow', 'gauge')
+}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')\
+        .replace('\n', '\\n')
+
+
+'''
+RequestSQL
+    the SQL statements of one request
+'''
+
+
+class RequestSQL:
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.texts = Counter()
+
+    def most_repeated(self):
+        if not self.texts:
+            return '', 0
+        return self.texts.most_common(1)[0]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('request_sql_started', []).append(
+        (context, time.perf_counter())
+    )
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    _, started = conn.info['request_sql_started'].pop()
+    sql = g.get('request_sql') if has_request_context() else None
+    if sql is None:
+        return
+    sql.statements += 1
+    sql.seconds += time.perf_counter() - started
+    # the rowcount of INSERT, UPDATE and DELETE counts the rows changed,
+    # only statements returning rows have a description
+    if cursor.description is not None:
+        sql.rows += max(cursor.rowcount, 0)
+    sql.texts[statement] += 1
+
+
+def handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute, drop its start
+    # time so it does not stay on the pooled connection
+    connection = exception_context.connection
+    started = connection.info.get('request_sql_started') \
+        if connection is not None else None
+    if started and started[-1][0] is exception_context.execution_context:
+        started.pop()
+
+
+'''
+listen_to_statements()
+    times the statements of every engine, once per process
+'''
+
+
+def listen_to_statements():
+    if not event.contains(Engine, 'before_cursor_execute',
+                          before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
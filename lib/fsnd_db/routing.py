@@ -0,0 +1,126 @@
+import os
+import random
+import time
+from collections import namedtuple
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'db_primary_until'
+
+Routing = namedtuple('Routing', ['replicas', 'sticky_seconds'])
+
+
+'''
+replica_binds(urls)
+    SQLALCHEMY_BINDS of a comma separated list of replica URIs,
+    keyed replica0, replica1...
+'''
+
+
+def replica_binds(urls):
+    urls = [url.strip() for url in (urls or '').split(',') if url.strip()]
+    return {'replica{}'.format(i): url for i, url in enumerate(urls)}
+
+
+'''
+RoutingSession
+    sends the queries of read only requests to one of the replicas and
+    everything else to the primary database
+        a request is read only when its method is GET, HEAD or OPTIONS and
+        it has no sticky cookie, see stick_to_primary()
+        a session which flushed stays on the primary, so a request reads
+        its own writes
+        queries outside a request (CLI, background threads) use the primary
+'''
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing:
+            self.info['primary'] = True
+        elif not self.info.get('primary') and reading():
+            replicas = self.app.extensions['db_routing'].replicas
+            if replicas:
+                if 'replica' not in self.info:
+                    # one replica per session, the reads of a request agree
+                    self.info['replica'] = random.choice(replicas)
+                return get_state(self.app).db.get_engine(
+                    self.app,
+                    bind=self.info['replica']
+                )
+        return super().get_bind(mapper, clause)
+
+
+def reading():
+    return has_request_context() and g.get('db_read_only', False)
+
+
+'''
+RoutingSQLAlchemy
+    SQLAlchemy using RoutingSession
+    configuration, read from the environment by default
+        DATABASE_REPLICA_URLS: comma separated replica URIs, reads use the
+            primary when empty
+        DATABASE_REPLICA_STICKY_SECONDS (5): how long the requests of a
+            client read from the primary after it wrote, it should exceed
+            the replication lag
+'''
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        urls = app.config.setdefault(
+            'DATABASE_REPLICA_URLS',
+            os.environ.get('DATABASE_REPLICA_URLS', '')
+        )
+        sticky_seconds = app.config.setdefault(
+            'DATABASE_REPLICA_STICKY_SECONDS',
+            int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 5))
+        )
+        binds = replica_binds(urls)
+        app.config['SQLALCHEMY_BINDS'] = dict(
+            app.config.get('SQLALCHEMY_BINDS') or {},
+            **binds
+        )
+        super().init_app(app)
+        if 'db_routing' not in app.extensions:
+            app.before_request(route_request)
+            app.after_request(stick_to_primary)
+        app.extensions['db_routing'] = Routing(sorted(binds), sticky_seconds)
+
+
+'''
+route_request()
+    marks a read only request, its queries may go to a replica
+'''
+
+
+def route_request():
+    sticky_until = request.cookies.get(STICKY_COOKIE, 0, type=float)
+    g.db_read_only = request.method in READ_METHODS\
+        and sticky_until < time.time()
+
+
+'''
+stick_to_primary(response)
+    after a successful write, sends a cookie keeping the reads of the
+    client on the primary for DATABASE_REPLICA_STICKY_SECONDS
+'''
+
+
+def stick_to_primary(response):
+    routing = current_app.extensions['db_routing']
+    if routing.replicas and request.method not in READ_METHODS\
+            and response.status_code < 400:
+        response.set_cookie(
+            STICKY_COOKIE,
+            str(time.time() + routing.sticky_seconds),
+            max_age=routing.sticky_seconds,
+            httponly=True
+        )
+    return response
@@ -0,0 +1,10 @@
+from setuptools import setup
+
+setup(
+    name='fsnd-db',
+    version='0.1.0',
+    description='Database pool settings, read replica routing, request '
+                'metrics and Auth0 token caches shared by the Flask projects',
+    packages=['fsnd_db', 'fsnd_auth'],
+    install_requires=['Flask', 'Flask-SQLAlchemy', 'SQLAlchemy'],
+)
@@ -5,7 +5,7 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context, jsonify
 from flask_moment import Moment
 from flask_migrate import Migrate
 import logging
@@ -14,9 +14,10 @@ from flask_wtf import Form
 from forms import *
 from flask_wtf.csrf import CSRFProtect
 from datetime import datetime
-from sqlalchemy.sql.functions import func
-from itertools import groupby
 from models import *
+from queries import venue_areas, has_more_areas, search_by_name, model_dict, venue_shows, artist_shows, AREAS_PER_PAGE, SEARCH_RESULTS_PER_PAGE
+from fsnd_db.metrics import RequestMetrics
+from generate_data import generate_data_command
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -33,6 +34,17 @@ migrate = Migrate(app, db)
 csrf = CSRFProtect(app)
 csrf.init_app(app)
 
+#----------------------------------------------------------------------------#
+# Request metrics, served on /metrics to local clients.
+#----------------------------------------------------------------------------#
+metrics = RequestMetrics(app)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+# `flask generate-data` bulk loads synthetic venues, artists and shows
+app.cli.add_command(generate_data_command)
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
@@ -51,6 +63,19 @@ def format_datetime(value, format='medium'):
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Streaming.
+#----------------------------------------------------------------------------#
+
+def stream_template(template_name, **context):
+  # renders the template chunk by chunk while the context generators are consumed,
+  # the request context stays alive until the last chunk is sent
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  stream = template.stream(context)
+  stream.enable_buffering(20)
+  return Response(stream_with_context(stream))
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -65,46 +90,50 @@ def index():
 
 @app.route('/venues')
 def venues():
-  items = Venue.query.\
-    with_entities(Venue.city, Venue.state, Venue.id, Venue.name, func.count(Show.id).label('num_shows'))\
-    .join(Show, (Show.venue_id==Venue.id) & (Show.start_time < datetime.now()), isouter=True )\
-    .group_by(Venue).all()
-  data = []
-  func_filter =  lambda item: (item.city, item.state)
-  for key, venues in groupby(sorted(items, key= func_filter) , func_filter):
-      tmp_venue = dict(zip(['city', 'state'], key))
-      tmp_venue["venues"] = list({'id': venue.id, 'name': venue.name, 'num_upcomping_shows': venue.num_shows } for venue in venues)
-      data.append(tmp_venue)
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+  # areas are grouped and counted by the database and streamed to the template,
+  # ?page=N limits the listing to AREAS_PER_PAGE areas
+  page = request.args.get('page', type=int)
+  if page is not None and page < 1:
+    abort(404)
+  per_page = request.args.get('per_page', AREAS_PER_PAGE, type=int)
+  per_page = min(max(per_page, 1), 100)
+  has_next = page is not None and has_more_areas(page, per_page)
+  return stream_template('pages/venues.html',
+    areas=venue_areas(page, per_page), page=page, per_page=per_page, has_next=has_next)
+
+def search_response(model):
+  search_for = request.values.get('search_term', '')
+  page = max(request.values.get('page', 1, type=int), 1)
+  count, data = search_by_name(model, search_for, page, SEARCH_RESULTS_PER_PAGE)
+  return {
+    "count": count,
+    "data": data,
+    "page": page,
+    "has_next": page * SEARCH_RESULTS_PER_PAGE < count
+  }, search_for
+
+@app.route('/venues/search', methods=['GET', 'POST'])
 # Disable CSRF for this route.
 @csrf.exempt
 def search_venues():
-  search_for = request.form.get('search_term', '')
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  venues = Venue.query.filter(Venue.name.ilike('%' + search_for + '%')).all()
-  response = {
-    "count": len(list(venues)),
-    "data": list(venues)
-  }
+  response, search_for = search_response(Venue)
   return render_template('pages/search_venues.html', results=response, search_term=search_for)
 
+def shows_pages():
+  # ?upcoming_page=&past_page= select the page of each side of a profile
+  return (
+    max(request.args.get('upcoming_page', 1, type=int), 1),
+    max(request.args.get('past_page', 1, type=int), 1)
+  )
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   try:
     # shows the venue page with the given venue_id
-    venue = Venue.query.get(venue_id).__dict__
-    shows = Show.query.with_entities(Show.artist_id, Show.start_time, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'))\
-      .filter(Show.venue_id==venue_id)\
-      .join(Venue, Venue.id==Show.venue_id, isouter=True)\
-      .join(Artist, Artist.id==Show.artist_id, isouter=True)\
-      .all()
-    venue['upcoming_shows'] = list(filter(lambda show: show.start_time < datetime.now(), shows))
-    venue['past_shows'] = list(filter(lambda show: show.start_time >= datetime.now(), shows))
-    venue['upcoming_shows_count'] = len(venue['upcoming_shows'])
-    venue['past_shows_count'] = len(venue['past_shows'])
+    venue = model_dict(Venue.query.get(venue_id))
+    venue.update(venue_shows(venue_id, *shows_pages()))
     return render_template('pages/show_venue.html', venue=venue)
   except Exception as e:
     flash('Resource not found.', 'danger')
@@ -160,33 +189,20 @@ def artists():
   data = Artist.query.with_entities(Artist.id, Artist.name).all()
   return render_template('pages/artists.html', artists=data)
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 # Disable CSRF for this route.
 @csrf.exempt
 def search_artists():
-  search_for = request.form.get('search_term', '')
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
-  artists = Artist.query.filter(Artist.name.ilike('%' + search_for + '%')).all()
-  response = {
-    "count": len(list(artists)),
-    "data": list(artists)
-  }
+  response, search_for = search_response(Artist)
   return render_template('pages/search_artists.html', results=response, search_term=search_for)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   try:
-    artist = Artist.query.get(artist_id).__dict__
-    shows = Show.query.with_entities(Show.venue_id, Show.start_time, Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link'))\
-      .filter(Show.artist_id==artist_id)\
-      .join(Venue, Venue.id==Show.venue_id, isouter=True)\
-      .join(Artist, Artist.id==Show.artist_id, isouter=True)\
-      .all()
-    artist['upcoming_shows'] = list(filter(lambda show: show.start_time < datetime.now(), shows))
-    artist['past_shows'] = list(filter(lambda show: show.start_time >= datetime.now(), shows))
-    artist['upcoming_shows_count'] = len(artist['upcoming_shows'])
-    artist['past_shows_count'] = len(artist['past_shows'])
+    artist = model_dict(Artist.query.get(artist_id))
+    artist.update(artist_shows(artist_id, *shows_pages()))
     return render_template('pages/show_artist.html', artist=artist)
   except Exception as e:
     flash('Resource not found.', 'danger')
@@ -295,13 +311,13 @@ def shows():
 @app.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
-  form = ShowForm()
+  form = ShowForm(typeahead=app.config.get('SHOW_FORM_TYPEAHEAD', False))
   return render_template('forms/new_show.html', form=form)
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  form = ShowForm(request.form)
+  form = ShowForm(request.form, typeahead=app.config.get('SHOW_FORM_TYPEAHEAD', False))
   if form.validate_on_submit():
     try:
       show = Show()
@@ -322,6 +338,22 @@ def create_show_submission():
     flash('An error occurred. Show could not be created.', 'danger')
     return render_template('forms/new_show.html', form=form)
 
+#  Typeahead choices
+#  ----------------------------------------------------------------
+
+def choices_response(model):
+  # best name matches for the show form typeahead
+  count, data = search_by_name(model, request.args.get('q', ''), 1, 20)
+  return jsonify(data)
+
+@app.route('/artists/choices')
+def artist_choices():
+  return choices_response(Artist)
+
+@app.route('/venues/choices')
+def venue_choices():
+  return choices_response(Venue)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,82 @@
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from models import db, Artist, Venue
+
+#----------------------------------------------------------------------------#
+# Select field choices.
+#----------------------------------------------------------------------------#
+
+class ChoicesCache:
+    '''
+    (id, name) choices of a model for select fields.
+    choices are loaded on first use, not at import time, and kept until a
+    transaction creating, editing or deleting a row of the model is
+    committed, or until `ttl` seconds passed so changes made by other
+    processes show up as well.
+    the flushed changes are only noted in the session, a flush rolled back
+    later leaves the cached choices as they were.
+    '''
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, model):
+        entry = self._entries.get(model)
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        version = self._versions.get(model, 0)
+        choices = [(row.id, row.name) for row in
+            db.session.query(model.id, model.name).order_by(model.name, model.id)]
+        with self._lock:
+            # a write committed while loading makes this result stale, don't keep it
+            if self._versions.get(model, 0) == version:
+                self._entries[model] = (choices, time.monotonic() + self.ttl)
+        return choices
+
+    def lookup(self, model, ids):
+        '''choices for the given ids only, used to validate typeahead submissions'''
+        ids = [value for value in ids if value is not None]
+        if not ids:
+            return []
+        return [(row.id, row.name) for row in
+            db.session.query(model.id, model.name).filter(model.id.in_(ids))]
+
+    def invalidate(self, model):
+        with self._lock:
+            self._versions[model] = self._versions.get(model, 0) + 1
+            self._entries.pop(model, None)
+
+    def watch(self, session, *models):
+        '''invalidate the choices of models when session commits a change'''
+        def note_change(changed_session, model):
+            changed_session.info.setdefault('choices_changed', set()).add(model)
+
+        def changed(mapper, connection, target):
+            note_change(object_session(target), mapper.class_)
+
+        def bulk_changed(context):
+            if context.mapper.class_ in models:
+                note_change(context.session, context.mapper.class_)
+
+        def committed(session):
+            for model in session.info.pop('choices_changed', ()):
+                self.invalidate(model)
+
+        def rolled_back(session):
+            session.info.pop('choices_changed', None)
+
+        for model in models:
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, name, changed)
+        event.listen(session, 'after_bulk_update', bulk_changed)
+        event.listen(session, 'after_bulk_delete', bulk_changed)
+        event.listen(session, 'after_commit', committed)
+        event.listen(session, 'after_rollback', rolled_back)
+
+
+choices_cache = ChoicesCache()
+choices_cache.watch(db.session, Artist, Venue)
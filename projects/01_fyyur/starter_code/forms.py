@@ -3,24 +3,36 @@ from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
 from wtforms.validators import DataRequired, AnyOf, URL
 from models import *
+from choices import choices_cache
 
 class ShowForm(Form):
+    # choices are filled per form instance, see __init__
     artist_id = SelectField(
         'artist_id',
-        coerce=int,
-        choices=list(Artist.query.with_entities(Artist.id, Artist.name).all())
+        coerce=int
     )
     venue_id = SelectField(
         'venue_id',
-        coerce=int,
-        choices=list(Venue.query.with_entities(Venue.id, Venue.name).all())
+        coerce=int
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        default=datetime.today
     )
 
+    def __init__(self, *args, typeahead=False, **kwargs):
+        super(ShowForm, self).__init__(*args, **kwargs)
+        # in typeahead mode the page queries /artists/choices and /venues/choices
+        # while typing, only the submitted ids are loaded to validate the form
+        self.typeahead = typeahead
+        if typeahead:
+            self.artist_id.choices = choices_cache.lookup(Artist, [self.artist_id.data])
+            self.venue_id.choices = choices_cache.lookup(Venue, [self.venue_id.data])
+        else:
+            self.artist_id.choices = choices_cache.get(Artist)
+            self.venue_id.choices = choices_cache.get(Venue)
+
 class VenueForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -0,0 +1,213 @@
+import csv
+import io
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from models import db, Venue, Artist, Show
+from forms import VenueForm
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+# `flask generate-data` bulk loads venues, artists and shows to profile the
+# listing and profile views against production sized tables. Rows are sent
+# with COPY on PostgreSQL and with one executemany per batch otherwise, the
+# ORM is not involved.
+#----------------------------------------------------------------------------#
+
+# (city, state, weight): a few big cities hold most of the venues and artists
+CITIES = [
+    ('New York', 'NY', 180), ('Los Angeles', 'CA', 140), ('Chicago', 'IL', 90),
+    ('San Francisco', 'CA', 70), ('Austin', 'TX', 60), ('Nashville', 'TN', 55),
+    ('Seattle', 'WA', 45), ('New Orleans', 'LA', 40), ('Atlanta', 'GA', 35),
+    ('Boston', 'MA', 35), ('Denver', 'CO', 30), ('Portland', 'OR', 28),
+    ('Miami', 'FL', 26), ('Philadelphia', 'PA', 24), ('Detroit', 'MI', 20),
+    ('Minneapolis', 'MN', 16), ('Memphis', 'TN', 14), ('Kansas City', 'MO', 10),
+    ('Albuquerque', 'NM', 6), ('Boise', 'ID', 4), ('Burlington', 'VT', 3),
+    ('Fargo', 'ND', 2),
+]
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+# rock, pop and hip-hop are far more common than musical theatre
+GENRE_WEIGHTS = [max(12 - abs(index - 8) * 2, 1) for index in range(len(GENRES))]
+# most shows start in the evening, and more of them on fridays and saturdays
+HOUR_WEIGHTS = [0] * 12 + [1, 1, 1, 1, 2, 3, 6, 10, 14, 12, 7, 3]
+WEEKDAY_WEIGHTS = [6, 6, 8, 10, 18, 20, 9]
+PAST_DAYS = 730
+FUTURE_DAYS = 180
+BATCH_SIZE = 10000
+
+
+def weighted(rng, values, weights):
+    '''a function drawing one of values per call'''
+    cum_weights = []
+    total = 0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+    return lambda: rng.choices(values, cum_weights=cum_weights)[0]
+
+
+def skewed_index(rng, count, skew=3):
+    '''
+    index in [0, count) skewed towards 0, so a few artists and venues get
+    many shows and most of them only a few: with skew 3 the first 1% of the
+    indexes get a fifth of the draws.
+    '''
+    return int(count * rng.random() ** skew)
+
+
+def venue_rows(rng, count, first):
+    city = weighted(rng, CITIES, [weight for _, _, weight in CITIES])
+    for number in range(first, first + count):
+        name, state, _ = city()
+        yield {
+            'name': 'The {} Hall {}'.format(rng.choice(['Blue', 'Red', 'Golden', 'Velvet', 'Iron', 'Silver']), number),
+            'city': name,
+            'state': state,
+            'address': '{} {} Street'.format(rng.randint(1, 9999), rng.choice(['Main', 'Market', 'Mission', 'Elm'])),
+            'phone': '{}-{}-{:04d}'.format(rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'website': 'https://venue{}.example.com'.format(number),
+            'image_link': 'https://images.example.com/venues/{}.jpg'.format(number),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(number),
+            'seeking_talent': rng.random() < 0.3,
+            'seeking_description': None,
+            'genres': genres(rng),
+        }
+
+
+def artist_rows(rng, count, first):
+    city = weighted(rng, CITIES, [weight for _, _, weight in CITIES])
+    for number in range(first, first + count):
+        name, state, _ = city()
+        yield {
+            'name': 'Artist {}'.format(number),
+            'city': name,
+            'state': state,
+            'phone': '{}-{}-{:04d}'.format(rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+            'genres': genres(rng),
+            'image_link': 'https://images.example.com/artists/{}.jpg'.format(number),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(number),
+            'website': None,
+            'seeking_venue': rng.random() < 0.4,
+            'seeking_description': None,
+        }
+
+
+def genres(rng):
+    return sorted(set(rng.choices(GENRES, weights=GENRE_WEIGHTS, k=rng.choice([1, 1, 2, 2, 3]))))
+
+
+def show_rows(rng, count, artist_ids, venue_ids):
+    '''
+    shows of the last PAST_DAYS days and the next FUTURE_DAYS days, the
+    popular artists and venues of skewed_index get most of them.
+    '''
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    hour = weighted(rng, range(24), HOUR_WEIGHTS)
+    # weights of every day of the window by weekday
+    days = list(range(-PAST_DAYS, FUTURE_DAYS))
+    day = weighted(rng, days, [WEEKDAY_WEIGHTS[(today + timedelta(days=offset)).weekday()] for offset in days])
+    # the skew is applied to a shuffled order, so popularity is not tied to the id
+    artist_order = array('q', artist_ids)
+    venue_order = array('q', venue_ids)
+    rng.shuffle(artist_order)
+    rng.shuffle(venue_order)
+    for _ in range(count):
+        yield {
+            'artist_id': artist_order[skewed_index(rng, len(artist_order))],
+            'venue_id': venue_order[skewed_index(rng, len(venue_order))],
+            'start_time': today + timedelta(days=day(), hours=hour(), minutes=rng.choice([0, 0, 15, 30, 45])),
+        }
+
+
+def copy_value(value):
+    '''text of a value in a COPY csv row'''
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '{' + ','.join('"{}"'.format(item.replace('\\', '\\\\').replace('"', '\\"')) for item in value) + '}'
+    return value
+
+
+def load(table, rows, batch_size):
+    '''
+    inserts the dicts of rows batch_size at a time, one transaction per
+    batch: COPY on PostgreSQL, an executemany INSERT on other databases.
+    returns the number of rows.
+    '''
+    use_copy = db.engine.dialect.name == 'postgresql'
+    columns = None
+    count = 0
+    batch = []
+
+    def flush():
+        if use_copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([copy_value(row[column]) for column in columns])
+            buffer.seek(0)
+            connection = db.engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                    table.name, ', '.join(columns)), buffer)
+                connection.commit()
+            finally:
+                connection.close()
+        else:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+
+    for row in rows:
+        if columns is None:
+            columns = list(row)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+            count += len(batch)
+            batch = []
+    if batch:
+        flush()
+        count += len(batch)
+    return count
+
+
+def ids(model):
+    return array('q', (id for id, in db.session.query(model.id).yield_per(BATCH_SIZE)))
+
+
+@click.command('generate-data')
+@click.option('--venues', default=10000, help='venues to add')
+@click.option('--artists', default=20000, help='artists to add')
+@click.option('--shows', default=1000000, help='shows to add, between all the venues and artists')
+@click.option('--batch-size', default=BATCH_SIZE, help='rows per COPY or INSERT')
+@click.option('--seed', default=0, help='random seed, the same seed generates the same rows')
+@with_appcontext
+def generate_data_command(venues, artists, shows, batch_size, seed):
+    '''Bulk load synthetic venues, artists and shows.'''
+    rng = random.Random(seed)
+    first_venue = db.session.query(Venue.id).count()
+    first_artist = db.session.query(Artist.id).count()
+    for table, rows in (
+        (Venue.__table__, venue_rows(rng, venues, first_venue)),
+        (Artist.__table__, artist_rows(rng, artists, first_artist)),
+    ):
+        start = time.perf_counter()
+        count = load(table, rows, batch_size)
+        click.echo('{:>9} {} rows in {:.1f}s'.format(count, table.name, time.perf_counter() - start))
+
+    artist_ids = ids(Artist)
+    venue_ids = ids(Venue)
+    if shows and not (artist_ids and venue_ids):
+        raise click.ClickException('shows need at least one venue and one artist.')
+    start = time.perf_counter()
+    count = load(Show.__table__, show_rows(rng, shows, artist_ids, venue_ids), batch_size)
+    click.echo('{:>9} {} rows in {:.1f}s'.format(count, Show.__table__.name, time.perf_counter() - start))
+
+    if db.engine.dialect.name == 'postgresql':
+        # fresh statistics, or the planner keeps estimating empty tables
+        db.session.execute('ANALYZE "Venue", "Artist", "Show"')
+        db.session.commit()
@@ -0,0 +1,26 @@
+"""Add listing indexes
+
+Revision ID: 6a9919aef7d7
+Revises: 7c77e13e43d0
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a9919aef7d7'
+down_revision = '7c77e13e43d0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
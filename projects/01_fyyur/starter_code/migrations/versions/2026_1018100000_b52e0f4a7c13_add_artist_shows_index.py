@@ -0,0 +1,24 @@
+"""Add artist shows index
+
+Revision ID: b52e0f4a7c13
+Revises: 3f1c2b7d9e40
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52e0f4a7c13'
+down_revision = '3f1c2b7d9e40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
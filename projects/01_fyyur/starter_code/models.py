@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, ARRAY, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, Text, ARRAY, ForeignKey, DateTime, DDL, event
 from sqlalchemy.orm import relationship
-from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
+from fsnd_db.routing import RoutingSQLAlchemy
 
 
 app = Flask(__name__)
@@ -12,15 +12,28 @@ app = Flask(__name__)
 
 app.config.from_object('config')
 
-# connect to a local postgresql database
-db = SQLAlchemy(app)
+# connect to a local postgresql database, reads may go to replicas
+db = RoutingSQLAlchemy(app)
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# the name search indexes need the pg_trgm extension
+event.listen(
+    db.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # /venues groups and orders by area
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        # trigram index answering the name search
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
@@ -42,6 +55,10 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # trigram index answering the name search
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
@@ -62,6 +79,11 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        # upcoming shows are counted per venue, profiles split shows on start_time
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
 
     id = Column(Integer, primary_key=True)
     artist_id = Column(Integer, ForeignKey('Artist.id'), nullable=False)
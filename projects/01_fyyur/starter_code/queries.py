@@ -0,0 +1,180 @@
+import heapq
+from itertools import groupby
+from sqlalchemy import case
+from sqlalchemy.sql.functions import func
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Query layer.
+# Listing queries shared by the controllers, the grouping, counting and
+# ordering is done by the database so the views only stream rows.
+#----------------------------------------------------------------------------#
+
+AREAS_PER_PAGE = 20
+SEARCH_RESULTS_PER_PAGE = 20
+SHOWS_PER_PAGE = 12
+# rows fetched per round trip when streaming large listings
+STREAM_BATCH_SIZE = 500
+
+
+def upcoming_show_counts():
+    '''
+    number of upcoming shows per venue, "upcoming" is evaluated by the
+    database clock so the whole listing uses a single point in time.
+    '''
+    return db.session.query(Show.venue_id, func.count(Show.id).label('num_upcoming_shows'))\
+        .filter(Show.start_time > func.now())\
+        .group_by(Show.venue_id)\
+        .subquery()
+
+
+def areas_query():
+    return db.session.query(Venue.city, Venue.state)\
+        .distinct()\
+        .order_by(Venue.city, Venue.state)
+
+
+def venue_areas(page=None, per_page=AREAS_PER_PAGE):
+    '''
+    yields the venues grouped by (city, state) with their upcoming shows count:
+        {'city': ..., 'state': ..., 'venues': [{'id', 'name', 'num_upcoming_shows'}]}
+    rows come from one query ordered by area, so only one area is held in
+    memory at a time. when page is given only per_page areas are returned.
+    '''
+    counts = upcoming_show_counts()
+    query = db.session.query(
+        Venue.city,
+        Venue.state,
+        Venue.id,
+        Venue.name,
+        func.coalesce(counts.c.num_upcoming_shows, 0).label('num_upcoming_shows'))\
+        .outerjoin(counts, counts.c.venue_id == Venue.id)
+    if page is not None:
+        areas = areas_query().limit(per_page).offset((page - 1) * per_page).subquery()
+        query = query.join(areas, (areas.c.city == Venue.city) & (areas.c.state == Venue.state))
+    rows = query.order_by(Venue.city, Venue.state, Venue.id).yield_per(STREAM_BATCH_SIZE)
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        yield {
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': venue.id,
+                'name': venue.name,
+                'num_upcoming_shows': venue.num_upcoming_shows
+            } for venue in venues]
+        }
+
+
+def has_more_areas(page, per_page=AREAS_PER_PAGE):
+    return areas_query().offset(page * per_page).limit(1).first() is not None
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_by_name(model, term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+    '''
+    case insensitive substring search on model.name (Venue or Artist)
+    returns (count, results) where results is one page of {'id', 'name'} dicts,
+    best matches first.
+    on PostgreSQL the match and the count are answered by the trigram index
+    and ranked with similarity(), other databases rank the matches in python.
+    '''
+    matches = model.name.ilike('%' + escape_like(term) + '%', escape='\\')
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return _search_trigram(model, term, matches, page, per_page)
+    return _search_python(model, term, matches, page, per_page)
+
+
+def _search_trigram(model, term, matches, page, per_page):
+    count = db.session.query(func.count(model.id)).filter(matches).scalar()
+    rank = func.similarity(model.name, term).label('rank')
+    rows = db.session.query(model.id, model.name, rank)\
+        .filter(matches)\
+        .order_by(rank.desc(), model.name, model.id)\
+        .limit(per_page)\
+        .offset((page - 1) * per_page)
+    return count, [{'id': row.id, 'name': row.name} for row in rows]
+
+
+def _search_python(model, term, matches, page, per_page):
+    # exact matches first, then earlier and tighter substring matches
+    needle = term.lower()
+    ranked = []
+    for row in db.session.query(model.id, model.name).filter(matches).yield_per(STREAM_BATCH_SIZE):
+        name = row.name.lower()
+        ranked.append((name != needle, name.find(needle), len(name), row.name, row.id))
+    best = heapq.nsmallest(page * per_page, ranked)[(page - 1) * per_page:]
+    return len(ranked), [{'id': item[4], 'name': item[3]} for item in best]
+
+
+def model_dict(obj):
+    '''column values of a model instance, without the SQLAlchemy state'''
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+
+def partitioned_shows(owner_column, columns, upcoming_page=1, past_page=1, per_page=SHOWS_PER_PAGE):
+    '''
+    one page of upcoming shows (soonest first) and one page of past shows
+    (latest first) of a venue or an artist, with the number of shows on each
+    side, in a single query:
+        - a CASE on start_time against the database clock splits the shows
+        - row_number() and count() over that partition give the position and
+          the total of each show, so only the requested pages are returned
+    '''
+    inner = db.session.query(
+        *columns,
+        Show.start_time,
+        case([(Show.start_time > func.now(), 1)], else_=0).label('is_upcoming'))\
+        .filter(owner_column)\
+        .subquery()
+    ranked = db.session.query(
+        inner,
+        func.row_number().over(
+            partition_by=inner.c.is_upcoming,
+            order_by=(case([(inner.c.is_upcoming == 1, inner.c.start_time)]), inner.c.start_time.desc())
+        ).label('position'),
+        func.count().over(partition_by=inner.c.is_upcoming).label('total'))\
+        .subquery()
+
+    upcoming_range = ((upcoming_page - 1) * per_page, upcoming_page * per_page)
+    past_range = ((past_page - 1) * per_page, past_page * per_page)
+    rows = db.session.query(ranked)\
+        .filter(
+            ((ranked.c.is_upcoming == 1) & (ranked.c.position > upcoming_range[0]) & (ranked.c.position <= upcoming_range[1])) |
+            ((ranked.c.is_upcoming == 0) & (ranked.c.position > past_range[0]) & (ranked.c.position <= past_range[1])) |
+            # the first row of each side is always returned to carry the total
+            (ranked.c.position == 1))\
+        .order_by(ranked.c.is_upcoming.desc(), ranked.c.position)
+
+    shows = {
+        'upcoming_shows': [],
+        'past_shows': [],
+        'upcoming_shows_count': 0,
+        'past_shows_count': 0,
+        'upcoming_page': upcoming_page,
+        'past_page': past_page,
+        'per_page': per_page
+    }
+    fields = [column.name for column in inner.c if column.name != 'is_upcoming']
+    for row in rows:
+        side, (start, end) = ('upcoming', upcoming_range) if row.is_upcoming else ('past', past_range)
+        shows[side + '_shows_count'] = row.total
+        if start < row.position <= end:
+            shows[side + '_shows'].append({field: getattr(row, field) for field in fields})
+    return shows
+
+
+def venue_shows(venue_id, upcoming_page=1, past_page=1, per_page=SHOWS_PER_PAGE):
+    return partitioned_shows(
+        (Show.venue_id == venue_id) & (Artist.id == Show.artist_id),
+        [Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')],
+        upcoming_page, past_page, per_page)
+
+
+def artist_shows(artist_id, upcoming_page=1, past_page=1, per_page=SHOWS_PER_PAGE):
+    return partitioned_shows(
+        (Show.artist_id == artist_id) & (Venue.id == Show.venue_id),
+        [Show.venue_id, Venue.name.label('venue_name'), Venue.image_link.label('venue_image_link')],
+        upcoming_page, past_page, per_page)
@@ -2,3 +2,33 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+
+// Typeahead inputs: fill the datalist with the names matching what is typed
+// and keep the id of the chosen name in the hidden target input.
+document.querySelectorAll('input.typeahead').forEach(function (input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var target = document.getElementById(input.dataset.target);
+  var choices = {};
+  var timer = null;
+
+  input.addEventListener('input', function () {
+    target.value = choices[input.value] || '';
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      fetch(input.dataset.source + '?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          choices = {};
+          list.innerHTML = '';
+          data.forEach(function (item) {
+            var option = document.createElement('option');
+            option.value = item.name;
+            choices[item.name] = item.id;
+            list.appendChild(option);
+          });
+          target.value = choices[input.value] || '';
+        });
+    }, 200);
+  });
+});
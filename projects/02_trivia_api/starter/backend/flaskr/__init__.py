@@ -2,16 +2,33 @@ import os
 from flask import Flask, request, abort, jsonify, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+from dotenv import load_dotenv, find_dotenv
 
-from models import setup_db, Question, Category
-
-QUESTIONS_PER_PAGE = 10
+from models import setup_db, db, Question
+from fsnd_db.engine import pool_stats
+from .categories import category_cache
+from fsnd_db.metrics import RequestMetrics
+from .pagination import CountCache
+from .questions import (
+  InvalidRequest, error_body, page_request, page_statement, count_statement, page_data,
+  search_condition, category_condition, select_question, quiz_index_statement, question_values, search_term,
+  quiz_category, quiz_request, question_dict
+)
+from .quiz import QuizEngine
+from .quiz_sessions import QuizSession, session_store
+from .write_behind import WriteBehind
 
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  # the database settings are stored in the .env file
+  load_dotenv(find_dotenv())
+  app.config['QUESTIONS_WRITE_BEHIND'] = os.environ.get('QUESTIONS_WRITE_BEHIND') == 'true'
+  app.config['QUIZ_SESSIONS_URL'] = os.environ.get('QUIZ_SESSIONS_URL', 'memory')
+  app.config['QUIZ_SESSION_TTL'] = int(os.environ.get('QUIZ_SESSION_TTL', 1800))
+  if test_config is not None:
+    app.config.update(test_config)
   setup_db(app)
 
   '''
@@ -20,6 +37,12 @@ def create_app(test_config=None):
   '''
   CORS(app)
 
+  '''
+  Latency, SQL statements and pool counters of the requests on /metrics,
+  served to local clients only.
+  '''
+  RequestMetrics(app, pool_stats=lambda: pool_stats(db.engine))
+
   '''
   Use the after_request decorator to set Access-Control-Allow
   '''
@@ -31,17 +54,80 @@ def create_app(test_config=None):
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
+  question_counts = CountCache()
+  quiz_engine = QuizEngine(lambda: db.session.execute(quiz_index_statement()))
+
+  def questions_changed():
+    question_counts.invalidate()
+    quiz_engine.invalidate()
+
+  '''
+  Quiz sessions keep the ids of the questions already asked on the server,
+  in memory or in redis (QUIZ_SESSIONS_URL), for QUIZ_SESSION_TTL seconds
+  after the last turn.
+  '''
+  quiz_sessions = session_store(app.config['QUIZ_SESSIONS_URL'], app.config['QUIZ_SESSION_TTL'])
+  app.extensions['quiz_sessions'] = quiz_sessions
+
+  '''
+  Pick the next quiz question of category which is not in previous.
+  the engine picks an id from its in-memory index, only that question is loaded.
+  an id deleted by another process invalidates the index and is picked again.
+  returns the formatted question, or None when every question was asked.
+  '''
+  def next_question(category, previous):
+    for attempt in range(2):
+      question_id = quiz_engine.pick(category, previous)
+      if question_id is None:
+        return None
+      row = db.session.execute(select_question(question_id)).first()
+      if row is not None:
+        return question_dict(row)
+      quiz_engine.invalidate()
+    return None
+
+  '''
+  With QUESTIONS_WRITE_BEHIND=true new questions are queued and inserted
+  in batches by a background thread, one commit for many create requests.
+  '''
+  question_writer = None
+  if app.config['QUESTIONS_WRITE_BEHIND']:
+    question_writer = WriteBehind(app, db, Question.__table__, on_write=questions_changed)
+  app.extensions['question_writer'] = question_writer
+
+  '''
+  Paginate the questions matching condition (None for every question), in
+  the page or cursor mode of the query string, see questions.page_request().
+  ?count=none (default), estimate or exact selects how total_questions is
+  computed in cursor mode, estimate is a count cached for a few seconds.
+  '''
+  def paginate_questions(condition, count_key):
+    try:
+      page = page_request(request.args)
+    except InvalidRequest as error:
+      abort(error.status)
+    data = page_data(db.session.execute(page_statement(condition, page)).fetchall(), page)
+    if page.count == 'exact':
+      data['total_questions'] = db.session.execute(count_statement(condition)).scalar()
+    elif page.count == 'estimate':
+      total = question_counts.cached(count_key)
+      if total is None:
+        total = question_counts.store(count_key, db.session.execute(count_statement(condition)).scalar())
+      data['total_questions'] = total
+    return data
+
   '''
   Get all available categories.
+  the body is encoded once per catalogue version, a request sending the
+  ETag back in If-None-Match gets a 304 without touching the database.
   '''
   @app.route("/api/v1/categories")
   def get_categories():
-    categories = Category.query.all()
-    formatted_categories = [category.format() for category in categories]
-    return jsonify({
-      'status': 'success',
-      'categories': formatted_categories
-    })
+    categories = category_cache.get()
+    response = app.response_class(categories.body, mimetype='application/json')
+    response.set_etag(categories.etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
   '''
   Paginate questions, 
@@ -56,17 +142,12 @@ def create_app(test_config=None):
   '''
   @app.route("/api/v1/questions")
   def get_questions():
-    page = request.args.get('page', 1, type=int)
-    questions = Question.query.paginate(page, QUESTIONS_PER_PAGE, False)
-    formatted_questions = [question.format() for question in questions.items]
-    categories = Category.query.all()
-    formatted_categories = [category.format() for category in categories]
-    return jsonify({
+    data = paginate_questions(None, 'all')
+    data.update({
       'status': 'success',
-      'total_questions': questions.total,
-      'questions': formatted_questions,
-      'categories': formatted_categories
+      'categories': category_cache.get().categories
     })
+    return jsonify(data)
 
   '''
   DELETE question using a question ID. 
@@ -82,6 +163,7 @@ def create_app(test_config=None):
         abort(404)
 
       question.delete()
+      questions_changed()
 
       return jsonify({
         'status': 'success',
@@ -99,19 +181,25 @@ def create_app(test_config=None):
   TEST: When you submit a question on the "Add" tab, 
   the form will clear and the question will appear at the end of the last page
   of the questions list in the "List" tab.  
+  In write-behind mode the question is queued and the response is a 202.
   '''
   @app.route("/api/v1/questions", methods=['POST'])
   def create_question():
     data = request.get_json(force=True)
     try:
-      question = data.get('question', None)
-      answer = data.get('answer', None)
-      category = data.get('category', None)
-      difficulty = data.get('difficulty', None)
-      if (None in [question, answer, category, difficulty]):
-        abort(422)
-      question = Question(question=question, answer=answer, category=category, difficulty=difficulty)
+      values = question_values(data)
+      if question_writer is not None:
+        # the row is written later, it has to be valid now
+        if values['category'] not in category_cache.get().by_id:
+          abort(422)
+        question_writer.add(values)
+        return jsonify({
+          'status': 'success',
+          'message': 'question queued',
+        }), 202
+      question = Question(**values)
       question.insert()
+      questions_changed()
       return jsonify({
         'status': 'success',
         'message': 'question created with success',
@@ -130,20 +218,11 @@ def create_app(test_config=None):
   '''
   @app.route("/api/v1/questions/search", methods=['POST'])
   def search_questions():
-    page = request.args.get('page', 1, type=int)
     try:
-      data = request.get_json(force=True)
-      search_for = data.get('searchTerm', None)
-      if search_for is None:
-        abort(422)
-      questions = Question.query.filter(Question.question.ilike(
-        "%{}%".format(search_for))).paginate(page, QUESTIONS_PER_PAGE, False)
-      formatted_questions = [question.format() for question in questions.items]
-      return jsonify({
-        'status': 'success',
-        'total_questions': questions.total,
-        'questions': formatted_questions,
-      })
+      search_for = search_term(request.get_json(force=True))
+      response = paginate_questions(search_condition(search_for), ('search', search_for))
+      response['status'] = 'success'
+      return jsonify(response)
     except:
       abort(422)
 
@@ -156,22 +235,17 @@ def create_app(test_config=None):
   '''
   @app.route("/api/v1/categories/<int:category_id>/questions")
   def questions_by_category(category_id):
-    page = request.args.get('page', 1, type=int)
     try:
-      category = Category.query.get(category_id)
+      category = category_cache.get().by_id.get(category_id)
       if category is None:
         abort(404)
 
-      questions = Question.query.filter(Question.category==category_id)\
-        .paginate(page, QUESTIONS_PER_PAGE, False)
-      formatted_questions = [question.format() for question in questions.items]
-
-      return jsonify({
+      data = paginate_questions(category_condition(category_id), ('category', category_id))
+      data.update({
         'status': 'success',
-        'total_questions': questions.total,
-        'questions': formatted_questions,
-        'current_category': category.format()
+        'current_category': category
       })
+      return jsonify(data)
     except:
       abort(404)
 
@@ -189,69 +263,88 @@ def create_app(test_config=None):
   @app.route("/api/v1/quizzes", methods=['POST'])
   def play_quiz():
     data = request.get_json(force=True)
-    previous_questions = data.get('previous_questions', None)
-    category = data.get('quiz_category', None)
     try:
-      if type(previous_questions) != list or type(category) != dict:
-        abort(400)
-      if category['id'] != 0:
-        questions = Question.query.filter(Question.category==category['id']).all()
-      else:
-        questions = Question.query.all()
-      formatted_questions = [question.format() for question in questions if question.id not in previous_questions]
-      if formatted_questions:
-        quiz_question = random.choice(formatted_questions)
-      else:
-        quiz_question = None
+      category_id, previous_questions = quiz_request(data)
       return jsonify({
         'status': 'success',
-        'question': quiz_question
+        'question': next_question(category_id, previous_questions)
       })
     except:
       abort(400)
 
+  '''
+  POST a new quiz session of a category, {"quiz_category": {"id": 0}} for
+  all the categories. The questions of the session are then asked one at
+  a time by POST /api/v1/quizzes/sessions/<session_id>/next, the client
+  does not send the previous questions.
+  '''
+  @app.route("/api/v1/quizzes/sessions", methods=['POST'])
+  def create_quiz_session():
+    data = request.get_json(force=True)
+    try:
+      session_id = quiz_sessions.create(QuizSession(quiz_category(data)))
+    except:
+      abort(400)
+    return jsonify({
+      'status': 'success',
+      'session_id': session_id,
+      'expires_in': app.config['QUIZ_SESSION_TTL']
+    })
+
+  '''
+  POST to get the next question of a quiz session, a question not asked
+  in the session yet, or null once every question of its category was asked.
+  404 for an unknown or expired session.
+  '''
+  @app.route("/api/v1/quizzes/sessions/<session_id>/next", methods=['POST'])
+  def next_quiz_question(session_id):
+    session = quiz_sessions.get(session_id)
+    if session is None:
+      abort(404)
+    quiz_question = next_question(session.category, session.seen)
+    if quiz_question is not None:
+      session.seen.add(quiz_question['id'])
+    quiz_sessions.save(session_id, session)
+    return jsonify({
+      'status': 'success',
+      'question': quiz_question,
+      'questions_asked': len(session.seen)
+    })
+
+  '''
+  DELETE a quiz session before it expires.
+  '''
+  @app.route("/api/v1/quizzes/sessions/<session_id>", methods=['DELETE'])
+  def delete_quiz_session(session_id):
+    if not quiz_sessions.delete(session_id):
+      abort(404)
+    return jsonify({
+      'status': 'success',
+      'session_id': session_id
+    })
+
   '''
   Error handlers for all expected errors 
   including 404 and 422. 
   '''
   @app.errorhandler(400)
   def bad_request(error):
-    return jsonify({
-      "status": "failed", 
-      "error": 400,
-      "message": "Bad request"
-      }), 400
+    return jsonify(error_body(400)), 400
 
   @app.errorhandler(404)
   def not_found(error):
-    return jsonify({
-      "status": "failed", 
-      "error": 404,
-      "message": "Not found"
-      }), 404
+    return jsonify(error_body(404)), 404
 
   @app.errorhandler(422)
   def unprocessable(error):
-    return jsonify({
-      "status": "failed", 
-      "error": 422,
-      "message": "unprocessable"
-      }), 422
+    return jsonify(error_body(422)), 422
 
   @app.errorhandler(405)
   def not_allowed(error):
-    return jsonify({
-      "status": "failed", 
-      "error": 405,
-      "message": "Method not allowed"
-      }), 405
+    return jsonify(error_body(405)), 405
 
   @app.errorhandler(500)
   def server_error(error):
-    return jsonify({
-      "status": "failed", 
-      "error": 500,
-      "message": "Internal Server Error"
-      }), 500
+    return jsonify(error_body(500)), 500
 
   return app
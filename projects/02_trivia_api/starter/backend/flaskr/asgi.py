@@ -0,0 +1,312 @@
+import asyncio
+import json
+import os
+import re
+from dotenv import load_dotenv, find_dotenv
+from databases import Database
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from models import database_url
+from .categories import CategoryCache, select_categories
+from .pagination import CountCache
+from .questions import (
+  InvalidRequest, ERROR_MESSAGES, error_body, page_request, page_statement, count_statement, page_data,
+  search_condition, category_condition, select_question, quiz_index_statement, insert_question,
+  delete_question, question_values, search_term, quiz_category, quiz_request, question_dict
+)
+from .quiz import QuizEngine
+from .quiz_sessions import QuizSession, MemorySessionStore, session_store
+
+'''
+ASGI entry point of the trivia API.
+A Starlette app serving the routes of create_app() in flaskr/__init__.py,
+quiz sessions included, with the same response bodies. The queries,
+the validation and the bodies come from flaskr/questions.py, the handlers
+run them through the async drivers of the databases package (asyncpg or
+aiosqlite) so a request waiting on the database holds no thread. The
+server builds the app from the factory:
+
+    uvicorn --factory flaskr.asgi:create_app --workers 2
+
+The write-behind queue, the read replicas and /metrics are only available
+in the Flask app.
+'''
+
+
+'''
+FlaskJSONResponse
+  a JSON response encoded like flask.jsonify: sorted keys, compact
+  separators, ascii only and a trailing newline
+'''
+class FlaskJSONResponse(JSONResponse):
+  def render(self, content):
+    return json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+'''
+database_options(database_path)
+  the options of the asyncpg pool, sized like the SQLAlchemy one from the
+  environment:
+    DB_POOL_SIZE + DB_MAX_OVERFLOW (5 + 10) connections at most,
+    opened on demand and closed after DB_POOL_RECYCLE (1800) idle seconds
+    DB_STATEMENT_TIMEOUT_MS (unset): statement_timeout of the connections
+  sqlite takes no option, each query opens its aiosqlite connection
+'''
+def database_options(database_path, environ=os.environ):
+  if not database_path.startswith('postgres'):
+    return {}
+  options = {
+    'min_size': 0,
+    'max_size': int(environ.get('DB_POOL_SIZE', 5)) + int(environ.get('DB_MAX_OVERFLOW', 10)),
+    'max_inactive_connection_lifetime': int(environ.get('DB_POOL_RECYCLE', 1800))
+  }
+  statement_timeout = environ.get('DB_STATEMENT_TIMEOUT_MS')
+  if statement_timeout:
+    options['server_settings'] = {'statement_timeout': str(int(statement_timeout))}
+  return options
+
+
+'''
+create_app(database_path)
+  the ASGI app of database_path, by default the database of the DB_*
+  variables of the .env file. the database is connected on the lifespan
+  startup event, nothing is sent to it before.
+'''
+def create_app(database_path=None):
+  load_dotenv(find_dotenv())
+  database_path = database_path or database_url()
+  # the databases package takes the URL without the SQLAlchemy driver name
+  database = Database(re.sub(r'^(\w+)\+\w+://', r'\1://', database_path), **database_options(database_path))
+  category_cache = CategoryCache()
+  question_counts = CountCache()
+  # loaded by load_quiz_index(), the index is never fetched synchronously
+  quiz_engine = QuizEngine(None)
+  session_ttl = int(os.environ.get('QUIZ_SESSION_TTL', 1800))
+  quiz_sessions = session_store(os.environ.get('QUIZ_SESSIONS_URL', 'memory'), session_ttl)
+  # the locks belong to the event loop of the server, created on startup
+  locks = {}
+
+  async def startup():
+    locks['quiz_index'] = asyncio.Lock()
+    await database.connect()
+
+  async def shutdown():
+    await database.disconnect()
+
+  def questions_changed():
+    question_counts.invalidate()
+    quiz_engine.invalidate()
+
+  async def json_body(request, status=400):
+    '''the decoded body whatever its content type, an error status when it is not json'''
+    try:
+      return json.loads(await request.body())
+    except ValueError:
+      raise HTTPException(status)
+
+  async def categories():
+    entry = category_cache.cached()
+    if entry is None:
+      version = category_cache.version
+      entry = category_cache.store(await database.fetch_all(select_categories()), version)
+    return entry
+
+  '''
+  sessions(method, *args)
+    calls a method of the quiz session store, in a thread unless the
+    sessions are kept in memory
+  '''
+  async def sessions(method, *args):
+    if isinstance(quiz_sessions, MemorySessionStore):
+      return getattr(quiz_sessions, method)(*args)
+    return await run_in_threadpool(getattr(quiz_sessions, method), *args)
+
+  '''
+  paginate_questions(request, condition, count_key)
+    paginate_questions() of create_app() in flaskr/__init__.py
+  '''
+  async def paginate_questions(request, condition, count_key):
+    page = page_request(request.query_params)
+    data = page_data(await database.fetch_all(page_statement(condition, page)), page)
+    if page.count == 'exact':
+      data['total_questions'] = await database.fetch_val(count_statement(condition))
+    elif page.count == 'estimate':
+      total = question_counts.cached(count_key)
+      if total is None:
+        total = question_counts.store(count_key, await database.fetch_val(count_statement(condition)))
+      data['total_questions'] = total
+    return data
+
+  async def load_quiz_index():
+    '''fetches the (category, id) rows of the quiz index when it has to be reloaded'''
+    if not quiz_engine.needs_reload():
+      return
+    async with locks['quiz_index']:
+      if quiz_engine.needs_reload():
+        quiz_engine.load(await database.fetch_all(quiz_index_statement()))
+
+  async def next_question(category, previous):
+    '''next_question() of create_app() in flaskr/__init__.py'''
+    for attempt in range(2):
+      await load_quiz_index()
+      question_id = quiz_engine.pick(category, previous)
+      if question_id is None:
+        return None
+      row = await database.fetch_one(select_question(question_id))
+      if row is not None:
+        return question_dict(row)
+      quiz_engine.invalidate()
+    return None
+
+  async def get_categories(request):
+    entry = await categories()
+    etag = '"{}"'.format(entry.etag)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]:
+      return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type='application/json', headers=headers)
+
+  async def get_questions(request):
+    data = await paginate_questions(request, None, 'all')
+    data.update({
+      'status': 'success',
+      'categories': (await categories()).categories
+    })
+    return FlaskJSONResponse(data)
+
+  async def delete_question_route(request):
+    question_id = request.path_params['question_id']
+    if await database.fetch_one(select_question(question_id)) is None:
+      raise HTTPException(404)
+    await database.execute(delete_question(question_id))
+    questions_changed()
+    return FlaskJSONResponse({
+      'status': 'success',
+      'question_id': question_id,
+      'message': 'question deleted with success',
+    })
+
+  async def create_question(request):
+    data = await json_body(request)
+    try:
+      await database.execute(insert_question(question_values(data)))
+    except Exception:
+      raise HTTPException(422)
+    questions_changed()
+    return FlaskJSONResponse({
+      'status': 'success',
+      'message': 'question created with success',
+    })
+
+  async def search_questions(request):
+    try:
+      search_for = search_term(await json_body(request, 422))
+      response = await paginate_questions(request, search_condition(search_for), ('search', search_for))
+    except Exception:
+      raise HTTPException(422)
+    response['status'] = 'success'
+    return FlaskJSONResponse(response)
+
+  async def questions_by_category(request):
+    category_id = request.path_params['category_id']
+    category = (await categories()).by_id.get(category_id)
+    if category is None:
+      raise HTTPException(404)
+    try:
+      data = await paginate_questions(request, category_condition(category_id), ('category', category_id))
+    except Exception:
+      raise HTTPException(404)
+    data.update({
+      'status': 'success',
+      'current_category': category
+    })
+    return FlaskJSONResponse(data)
+
+  async def play_quiz(request):
+    data = await json_body(request)
+    try:
+      category_id, previous_questions = quiz_request(data)
+      quiz_question = await next_question(category_id, previous_questions)
+    except Exception:
+      raise HTTPException(400)
+    return FlaskJSONResponse({
+      'status': 'success',
+      'question': quiz_question
+    })
+
+  async def create_quiz_session(request):
+    session_id = await sessions('create', QuizSession(quiz_category(await json_body(request))))
+    return FlaskJSONResponse({
+      'status': 'success',
+      'session_id': session_id,
+      'expires_in': session_ttl
+    })
+
+  async def next_quiz_question(request):
+    session_id = request.path_params['session_id']
+    session = await sessions('get', session_id)
+    if session is None:
+      raise HTTPException(404)
+    quiz_question = await next_question(session.category, session.seen)
+    if quiz_question is not None:
+      session.seen.add(quiz_question['id'])
+    await sessions('save', session_id, session)
+    return FlaskJSONResponse({
+      'status': 'success',
+      'question': quiz_question,
+      'questions_asked': len(session.seen)
+    })
+
+  async def delete_quiz_session(request):
+    session_id = request.path_params['session_id']
+    if not await sessions('delete', session_id):
+      raise HTTPException(404)
+    return FlaskJSONResponse({
+      'status': 'success',
+      'session_id': session_id
+    })
+
+  async def http_error(request, error):
+    if error.status_code not in ERROR_MESSAGES:
+      return Response(status_code=error.status_code)
+    return FlaskJSONResponse(error_body(error.status_code), error.status_code)
+
+  async def invalid_request(request, error):
+    return FlaskJSONResponse(error_body(error.status), error.status)
+
+  async def server_error(request, error):
+    return FlaskJSONResponse(error_body(500), 500)
+
+  return Starlette(
+    routes=[
+      Route('/api/v1/categories', get_categories, methods=['GET']),
+      Route('/api/v1/questions', get_questions, methods=['GET']),
+      Route('/api/v1/questions', create_question, methods=['POST']),
+      Route('/api/v1/questions/{question_id:int}', delete_question_route, methods=['DELETE']),
+      Route('/api/v1/questions/search', search_questions, methods=['POST']),
+      Route('/api/v1/categories/{category_id:int}/questions', questions_by_category, methods=['GET']),
+      Route('/api/v1/quizzes', play_quiz, methods=['POST']),
+      Route('/api/v1/quizzes/sessions', create_quiz_session, methods=['POST']),
+      Route('/api/v1/quizzes/sessions/{session_id}/next', next_quiz_question, methods=['POST']),
+      Route('/api/v1/quizzes/sessions/{session_id}', delete_quiz_session, methods=['DELETE'])
+    ],
+    middleware=[
+      Middleware(
+        CORSMiddleware,
+        allow_origins=['http://localhost:3000'],
+        allow_headers=['Content-Type', 'Authorization'],
+        allow_methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'],
+        allow_credentials=True
+      )
+    ],
+    exception_handlers={HTTPException: http_error, InvalidRequest: invalid_request, 500: server_error},
+    on_startup=[startup],
+    on_shutdown=[shutdown]
+  )
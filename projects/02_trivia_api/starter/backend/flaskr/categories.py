@@ -0,0 +1,110 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+
+from models import db, Category
+
+'''
+CategoryEntry
+  categories: the formatted categories, ordered by id
+  by_id: the formatted categories indexed by id
+  body: encoded json body of GET /categories
+  etag: strong validator of body
+'''
+CategoryEntry = namedtuple('CategoryEntry', ['categories', 'by_id', 'body', 'etag'])
+
+
+'''
+category_entry(categories)
+  the CategoryEntry of a list of formatted categories ordered by id
+'''
+def category_entry(categories):
+  body = json.dumps({'status': 'success', 'categories': categories}, separators=(',', ':')).encode('utf-8') + b'\n'
+  return CategoryEntry(categories, {category['id']: category for category in categories}, body, hashlib.sha1(body).hexdigest())
+
+
+'''
+select_categories()
+  the statement reading the (id, type) rows of the categories, ordered by id
+'''
+def select_categories():
+  categories = Category.__table__
+  return select([categories.c.id, categories.c.type]).order_by(categories.c.id)
+
+
+'''
+CategoryCache
+  the category catalogue, loaded on first use and kept with its encoded
+  json body until a transaction creating, editing or deleting a category
+  is committed, or until ttl seconds passed so changes made by other
+  processes show up as well. a flush rolled back later keeps the entry.
+  the ASGI app fetches the rows itself and keeps them with cached() and
+  store().
+'''
+class CategoryCache:
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self.version = 0
+    self._entry = None
+    self._expires_at = 0
+    self._lock = threading.Lock()
+
+  def get(self):
+    entry = self.cached()
+    if entry is not None:
+      return entry
+    version = self.version
+    return self.store(db.session.execute(select_categories()), version)
+
+  def cached(self):
+    '''the entry, None once it expired'''
+    entry = self._entry
+    if entry is not None and time.monotonic() < self._expires_at:
+      return entry
+    return None
+
+  def store(self, rows, version):
+    '''the entry of the (id, type) rows of select_categories(), read at version'''
+    entry = category_entry([{'id': row['id'], 'type': row['type']} for row in rows])
+    with self._lock:
+      # a write committed while loading makes this result stale, don't keep it
+      if self.version == version:
+        self._entry = entry
+        self._expires_at = time.monotonic() + self.ttl
+    return entry
+
+  def invalidate(self):
+    with self._lock:
+      self.version += 1
+      self._entry = None
+
+  def watch(self, session, model):
+    '''invalidates the entry when session commits a change of model'''
+    def changed(mapper, connection, target):
+      object_session(target).info['categories_changed'] = True
+
+    def bulk_changed(context):
+      if context.mapper.class_ is model:
+        context.session.info['categories_changed'] = True
+
+    def committed(session):
+      if session.info.pop('categories_changed', False):
+        self.invalidate()
+
+    def rolled_back(session):
+      session.info.pop('categories_changed', None)
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+      event.listen(model, name, changed)
+    event.listen(session, 'after_bulk_update', bulk_changed)
+    event.listen(session, 'after_bulk_delete', bulk_changed)
+    event.listen(session, 'after_commit', committed)
+    event.listen(session, 'after_rollback', rolled_back)
+
+
+category_cache = CategoryCache()
+category_cache.watch(db.session, Category)
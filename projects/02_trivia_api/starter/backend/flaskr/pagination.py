@@ -0,0 +1,74 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+
+'''
+Keyset (cursor) pagination.
+A cursor is an opaque token holding the id of the last row of a page,
+the next page seeks on `id > last_id` (see questions.page_statement())
+so every page costs the same whatever its depth.
+'''
+
+
+class InvalidCursor(ValueError):
+  pass
+
+
+def encode_cursor(last_id):
+  data = json.dumps({'id': last_id}, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+  '''returns the last id held by cursor, or None for the first page'''
+  if not cursor:
+    return None
+  try:
+    data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    return int(json.loads(data)['id'])
+  except (ValueError, TypeError, KeyError):
+    raise InvalidCursor(cursor)
+
+
+class CountCache:
+  '''
+  exact counts kept for `ttl` seconds and served as estimates,
+  so listing clients don't run a COUNT(*) per page.
+  every search term gets its own count, at most `maxsize` counts are kept
+  and the least recently used one is dropped to make room for a new one.
+  '''
+
+  def __init__(self, ttl=30, maxsize=1024):
+    self.ttl = ttl
+    self.maxsize = maxsize
+    self._counts = OrderedDict()
+    self._lock = threading.Lock()
+
+  def cached(self, key):
+    '''the count stored for key, None once it expired'''
+    with self._lock:
+      entry = self._counts.get(key)
+      if entry is None:
+        return None
+      if time.monotonic() >= entry[1]:
+        del self._counts[key]
+        return None
+      self._counts.move_to_end(key)
+      return entry[0]
+
+  def store(self, key, count):
+    with self._lock:
+      self._counts[key] = (count, time.monotonic() + self.ttl)
+      self._counts.move_to_end(key)
+      while len(self._counts) > self.maxsize:
+        self._counts.popitem(last=False)
+    return count
+
+  def invalidate(self):
+    with self._lock:
+      self._counts.clear()
+
+  def __len__(self):
+    return len(self._counts)
@@ -0,0 +1,181 @@
+from collections import namedtuple
+from sqlalchemy import func, select
+
+from models import Question
+from .pagination import encode_cursor, decode_cursor, InvalidCursor
+
+'''
+Queries, request validation and response bodies of the question endpoints,
+shared by the Flask app of create_app() and the ASGI app of flaskr/asgi.py.
+The queries are SQLAlchemy core statements, run by the Flask app through
+db.session.execute() and by the ASGI app through the async driver of the
+databases package.
+'''
+
+QUESTIONS_PER_PAGE = 10
+questions = Question.__table__
+QUESTION_COLUMNS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+ERROR_MESSAGES = {
+  400: 'Bad request',
+  404: 'Not found',
+  405: 'Method not allowed',
+  422: 'unprocessable',
+  500: 'Internal Server Error'
+}
+
+
+'''
+InvalidRequest
+  raised by the validation helpers, status is the HTTP error to answer
+'''
+class InvalidRequest(ValueError):
+  def __init__(self, status):
+    super().__init__(status)
+    self.status = status
+
+
+def error_body(status):
+  return {
+    'status': 'failed',
+    'error': status,
+    'message': ERROR_MESSAGES[status]
+  }
+
+
+def question_dict(row):
+  '''the Question.format() dict of a row of the questions table'''
+  return {column: row[column] for column in QUESTION_COLUMNS}
+
+
+'''
+Page
+  the page of questions asked by the query string of a listing request
+    page mode (default): ?page=N, OFFSET pagination with the exact total
+    cursor mode: ?cursor= for the first page then ?cursor=<next_cursor>,
+      seeks on the question id so deep pages cost the same as the first one
+    count: how total_questions is computed, 'exact', 'estimate' (a count
+      cached for a few seconds) or None to leave it out, always exact in
+      page mode
+'''
+Page = namedtuple('Page', ['cursor_mode', 'number', 'last_id', 'count'])
+
+
+def page_request(args):
+  '''the Page of the query string args, InvalidRequest(400) when invalid'''
+  if 'cursor' not in args:
+    try:
+      number = int(args.get('page', 1))
+    except ValueError:
+      number = 1
+    return Page(False, max(number, 1), None, 'exact')
+
+  count = args.get('count', 'none')
+  if count not in ('none', 'estimate', 'exact'):
+    raise InvalidRequest(400)
+  try:
+    last_id = decode_cursor(args['cursor'])
+  except InvalidCursor:
+    raise InvalidRequest(400)
+  return Page(True, None, last_id, None if count == 'none' else count)
+
+
+def page_statement(condition, page):
+  '''the questions of page matching condition (None for every question)'''
+  statement = select([questions.c[column] for column in QUESTION_COLUMNS])
+  if condition is not None:
+    statement = statement.where(condition)
+  statement = statement.order_by(questions.c.id)
+  if not page.cursor_mode:
+    return statement.limit(QUESTIONS_PER_PAGE).offset((page.number - 1) * QUESTIONS_PER_PAGE)
+  if page.last_id is not None:
+    statement = statement.where(questions.c.id > page.last_id)
+  # one more row tells whether a next page exists
+  return statement.limit(QUESTIONS_PER_PAGE + 1)
+
+
+def count_statement(condition):
+  statement = select([func.count()]).select_from(questions)
+  return statement.where(condition) if condition is not None else statement
+
+
+def page_data(rows, page):
+  '''the questions (and next_cursor in cursor mode) of the rows of page_statement()'''
+  if not page.cursor_mode:
+    return {'questions': [question_dict(row) for row in rows]}
+  next_cursor = None
+  if len(rows) > QUESTIONS_PER_PAGE:
+    rows = rows[:QUESTIONS_PER_PAGE]
+    next_cursor = encode_cursor(rows[-1]['id'])
+  return {
+    'questions': [question_dict(row) for row in rows],
+    'next_cursor': next_cursor
+  }
+
+
+def search_condition(search_for):
+  return questions.c.question.ilike('%{}%'.format(search_for))
+
+
+def category_condition(category_id):
+  return questions.c.category == category_id
+
+
+def select_question(question_id):
+  return select([questions.c[column] for column in QUESTION_COLUMNS]).where(questions.c.id == question_id)
+
+
+def quiz_index_statement():
+  return select([questions.c.category, questions.c.id])
+
+
+def insert_question(values):
+  return questions.insert().values(**values)
+
+
+def delete_question(question_id):
+  return questions.delete().where(questions.c.id == question_id)
+
+
+def question_values(data):
+  '''the columns of a new question posted as data, InvalidRequest(422) when invalid'''
+  try:
+    values = {name: data.get(name, None) for name in ('question', 'answer', 'category', 'difficulty')}
+    if None in values.values():
+      raise InvalidRequest(422)
+    values['category'] = int(values['category'])
+    values['difficulty'] = int(values['difficulty'])
+  except (AttributeError, TypeError, ValueError):
+    raise InvalidRequest(422)
+  return values
+
+
+def search_term(data):
+  '''the searchTerm posted as data, InvalidRequest(422) when missing'''
+  search_for = data.get('searchTerm', None) if isinstance(data, dict) else None
+  if search_for is None:
+    raise InvalidRequest(422)
+  return search_for
+
+
+def quiz_category(data):
+  '''the id of the quiz_category posted as data, InvalidRequest(400) when invalid'''
+  category = data.get('quiz_category', None) if isinstance(data, dict) else None
+  try:
+    if type(category) != dict:
+      raise InvalidRequest(400)
+    return int(category['id'])
+  except (KeyError, TypeError, ValueError):
+    raise InvalidRequest(400)
+
+
+def quiz_request(data):
+  '''the (category id, previous question ids) of a quiz turn, InvalidRequest(400) when invalid'''
+  category_id = quiz_category(data)
+  previous_questions = data.get('previous_questions', None)
+  if type(previous_questions) != list:
+    raise InvalidRequest(400)
+  try:
+    return category_id, set(previous_questions)
+  except TypeError:
+    raise InvalidRequest(400)
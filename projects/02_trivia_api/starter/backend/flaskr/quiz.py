@@ -0,0 +1,81 @@
+import random
+import threading
+import time
+from array import array
+
+ALL_CATEGORIES = 0
+
+
+'''
+QuizEngine
+  picks a random question the player has not seen yet without loading the
+  question bank.
+
+  the ids of the questions of every category are kept in memory as arrays
+  of integers, loaded through load_ids() (an iterable of (category, id)
+  rows) and loaded again after invalidate() or once ttl seconds passed.
+  with load_ids=None the caller fetches the rows and calls load() when
+  needs_reload() is true, as the async app does.
+  a pick draws random positions of the category index and rejects the
+  previous questions with set lookups, the remaining ids are only scanned
+  when most of the category was already played.
+'''
+class QuizEngine:
+  def __init__(self, load_ids, ttl=300, max_draws=16):
+    self.load_ids = load_ids
+    self.ttl = ttl
+    self.max_draws = max_draws
+    self._index = None
+    self._expires_at = 0
+    self._lock = threading.Lock()
+
+  def needs_reload(self):
+    return self._index is None or time.monotonic() >= self._expires_at
+
+  '''
+  load(rows)
+    replaces the index with the one of the given (category, id) rows,
+    callers which fetch the rows themselves check needs_reload() first
+  '''
+  def load(self, rows):
+    index = {ALL_CATEGORIES: array('q')}
+    for category, question_id in rows:
+      index.setdefault(category, array('q')).append(question_id)
+      index[ALL_CATEGORIES].append(question_id)
+    self._index = index
+    self._expires_at = time.monotonic() + self.ttl
+
+  def invalidate(self):
+    self._index = None
+
+  def ids(self, category=ALL_CATEGORIES):
+    index = self._index
+    if self.load_ids is None:
+      # the caller loads the index itself, an expired one is still used
+      return index.get(category, ()) if index is not None else ()
+    if index is None or time.monotonic() >= self._expires_at:
+      with self._lock:
+        if self.needs_reload():
+          self.load(self.load_ids())
+        index = self._index
+    return index.get(category, ())
+
+  '''
+  pick(category, previous)
+    returns the id of a random question of category which is not in
+    previous, or None when every question of the category was played
+  '''
+  def pick(self, category=ALL_CATEGORIES, previous=()):
+    ids = self.ids(category)
+    if not ids:
+      return None
+    excluded = previous if isinstance(previous, (set, frozenset)) else set(previous)
+    if len(excluded) < len(ids):
+      for _ in range(self.max_draws):
+        candidate = ids[random.randrange(len(ids))]
+        if candidate not in excluded:
+          return candidate
+    remaining = [question_id for question_id in ids if question_id not in excluded]
+    if remaining:
+      return random.choice(remaining)
+    return None
@@ -0,0 +1,120 @@
+import secrets
+import struct
+import threading
+import time
+from array import array
+
+HEADER = struct.Struct('<q')
+
+
+'''
+QuizSession
+  the state of a quiz played through /api/v1/quizzes/sessions
+    category: id of the quiz category, 0 for all the categories
+    seen: set of the ids of the questions already asked, passed as is to
+      QuizEngine.pick() so a turn costs the same whatever the quiz length
+  dumps() packs it in 8 bytes per seen question for the redis store
+'''
+class QuizSession:
+  __slots__ = ('category', 'seen')
+
+  def __init__(self, category, seen=()):
+    self.category = category
+    self.seen = set(seen)
+
+  def dumps(self):
+    return HEADER.pack(self.category) + array('q', sorted(self.seen)).tobytes()
+
+  @classmethod
+  def loads(cls, data):
+    seen = array('q')
+    seen.frombytes(data[HEADER.size:])
+    return cls(HEADER.unpack_from(data)[0], seen)
+
+
+'''
+MemorySessionStore
+  sessions of this process, dropped ttl seconds after their last save().
+  expired sessions are swept at most every ttl / 10 seconds on create().
+  every process has its own sessions, use the redis store with several
+  workers.
+'''
+class MemorySessionStore:
+  def __init__(self, ttl=1800):
+    self.ttl = ttl
+    self._sessions = {}
+    self._next_sweep = time.monotonic() + ttl / 10
+    self._lock = threading.Lock()
+
+  def create(self, session):
+    session_id = secrets.token_urlsafe(16)
+    now = time.monotonic()
+    with self._lock:
+      if now >= self._next_sweep:
+        self._sessions = {key: entry for key, entry in self._sessions.items() if entry[0] > now}
+        self._next_sweep = now + self.ttl / 10
+      self._sessions[session_id] = (now + self.ttl, session)
+    return session_id
+
+  def get(self, session_id):
+    entry = self._sessions.get(session_id)
+    if entry is None or entry[0] <= time.monotonic():
+      return None
+    return entry[1]
+
+  def save(self, session_id, session):
+    with self._lock:
+      self._sessions[session_id] = (time.monotonic() + self.ttl, session)
+
+  def delete(self, session_id):
+    with self._lock:
+      return self._sessions.pop(session_id, None) is not None
+
+  def __len__(self):
+    return len(self._sessions)
+
+
+'''
+RedisSessionStore
+  sessions stored under prefix + session id with a ttl seconds expiry,
+  refreshed by every save(), and shared by every process.
+  client is a redis.Redis or any client with its get, set(ex=) and delete
+  methods. two turns of the same session sent at once both ask a new
+  question, the last one saved wins.
+'''
+class RedisSessionStore:
+  def __init__(self, client, ttl=1800, prefix='trivia:quiz-session:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def create(self, session):
+    session_id = secrets.token_urlsafe(16)
+    self.save(session_id, session)
+    return session_id
+
+  def get(self, session_id):
+    data = self.client.get(self.prefix + session_id)
+    if data is None:
+      return None
+    return QuizSession.loads(data)
+
+  def save(self, session_id, session):
+    self.client.set(self.prefix + session_id, session.dumps(), ex=self.ttl)
+
+  def delete(self, session_id):
+    return bool(self.client.delete(self.prefix + session_id))
+
+
+'''
+session_store(url, ttl)
+  the store of QUIZ_SESSIONS_URL: 'memory' or a redis:// URL, which needs
+  the redis package
+'''
+def session_store(url, ttl):
+  if url == 'memory':
+    return MemorySessionStore(ttl)
+  if url.startswith(('redis://', 'rediss://', 'unix://')):
+    import redis
+    return RedisSessionStore(redis.Redis.from_url(url), ttl)
+  raise ValueError('unknown quiz session store {}'.format(url))
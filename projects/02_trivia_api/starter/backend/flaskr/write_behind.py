@@ -0,0 +1,74 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+'''
+WriteBehind
+  inserts rows of a table from a background thread, many at a time.
+
+  add() only queues the column values of a row and returns, the thread
+  inserts up to max_batch queued rows with one executemany and one commit
+  at most every `interval` seconds, so N create requests cost one commit.
+  the rows must be validated before they are added, a row is acknowledged
+  before it is written and rows still queued when the process is killed
+  are lost. flush() blocks until every queued row is written.
+'''
+class WriteBehind:
+  def __init__(self, app, db, table, interval=0.05, max_batch=500, on_write=None):
+    self.app = app
+    self.db = db
+    self.table = table
+    self.interval = interval
+    self.max_batch = max_batch
+    self.on_write = on_write
+    self.written = 0
+    self.failed = 0
+    self._queue = queue.Queue()
+    self._thread = threading.Thread(target=self._run, name='write-behind-' + table.name, daemon=True)
+    self._thread.start()
+    atexit.register(self.flush)
+
+  def add(self, values):
+    self._queue.put(values)
+
+  def flush(self):
+    self._queue.join()
+
+  def _run(self):
+    while True:
+      rows = [self._queue.get()]
+      deadline = time.monotonic() + self.interval
+      while len(rows) < self.max_batch:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+          break
+        try:
+          rows.append(self._queue.get(timeout=timeout))
+        except queue.Empty:
+          break
+      try:
+        self._write(rows)
+      finally:
+        for _ in rows:
+          self._queue.task_done()
+
+  def _write(self, rows):
+    with self.app.app_context():
+      try:
+        self.db.session.execute(self.table.insert(), rows)
+        self.db.session.commit()
+        self.written += len(rows)
+      except Exception:
+        self.db.session.rollback()
+        self.failed += len(rows)
+        logger.exception('write-behind: %d rows of %s were not written', len(rows), self.table.name)
+        return
+      finally:
+        self.db.session.remove()
+    if self.on_write is not None:
+      self.on_write()
@@ -1,28 +1,83 @@
 import os
+from contextlib import contextmanager
 from sqlalchemy import Column, String, Integer, create_engine, ForeignKey
 from sqlalchemy.orm import relationship
-from flask_sqlalchemy import SQLAlchemy
 import json
-from dotenv import load_dotenv, find_dotenv
+import click
+from flask.cli import with_appcontext
+from fsnd_db.engine import engine_options
+from fsnd_db.routing import RoutingSQLAlchemy
 
-# load environment variables
-load_dotenv(find_dotenv())
-# Secret variables stored in .flaskenv file
-database_path = "postgresql://{}:{}@{}:{}/{}".format(os.getenv("DB_USERNAME"), os.getenv("DB_PASSWD"), os.getenv("DB_HOST"), os.getenv("DB_PORT"), os.getenv("DB_NAME"))
-print(database_path)
+db = RoutingSQLAlchemy()
 
-db = SQLAlchemy()
+'''
+database_url()
+    the database URI built from the DB_* environment variables,
+    stored in the .env file (see .sample)
+'''
+def database_url():
+    return "postgresql://{}:{}@{}:{}/{}".format(os.getenv("DB_USERNAME"), os.getenv("DB_PASSWD"), os.getenv("DB_HOST"), os.getenv("DB_PORT"), os.getenv("DB_NAME"))
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    nothing is sent to the database, the tables are created with
+    `flask create-db` or restored from trivia.psql
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=None):
+    database_path = database_path or database_url()
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    app.cli.add_command(create_db_command)
+
+'''
+flask create-db
+    creates the missing tables
+'''
+@click.command('create-db')
+@with_appcontext
+def create_db_command():
+  db.create_all()
+  click.echo('Created the database tables.')
+
+'''
+unit_of_work()
+    stages the changes of every insert(), update() and delete() call made
+    inside the block and commits them once when it exits, or rolls them
+    all back when it raises. blocks can be nested, the outermost commits.
+    EXAMPLE
+        with unit_of_work():
+            question.delete()
+            Question(question, answer, category, difficulty).insert()
+'''
+@contextmanager
+def unit_of_work():
+  depth = db.session.info.get('unit_of_work', 0)
+  db.session.info['unit_of_work'] = depth + 1
+  try:
+    yield db.session
+    if depth == 0:
+      db.session.commit()
+  except:
+    if depth == 0:
+      db.session.rollback()
+    raise
+  finally:
+    db.session.info['unit_of_work'] = depth
+
+'''
+commit()
+    commits the session, or only flushes it inside a unit_of_work so
+    the ids are assigned and the commit is left to the block
+'''
+def commit():
+  if db.session.info.get('unit_of_work'):
+    db.session.flush()
+  else:
+    db.session.commit()
 
 '''
 Question
@@ -45,14 +100,14 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
-    db.session.commit()
+    commit()
   
   def update(self):
-    db.session.commit()
+    commit()
 
   def delete(self):
     db.session.delete(self)
-    db.session.commit()
+    commit()
 
   def format(self):
     return {
@@ -1,11 +1,18 @@
+import asyncio
 import os
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 import random
+import tempfile
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.categories import category_cache
+from flaskr.pagination import CountCache
+from flaskr.quiz_sessions import QuizSession, MemorySessionStore, RedisSessionStore
+from models import setup_db, db, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -20,9 +27,8 @@ class TriviaTestCase(unittest.TestCase):
 
         # binds the app to the current context
         with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
+            self.db = db
+            # create all tables, setup_db does not touch the database
             self.db.create_all()
     
     def tearDown(self):
@@ -45,6 +51,34 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 405)
         self.assertEqual(data['status'], 'failed')
 
+    def test_get_questions_cursor(self):
+        """Test list questions endpoint in cursor mode """
+        res = self.client().get('/api/v1/questions?cursor=&count=exact')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['status'], 'success')
+
+        ids = [question['id'] for question in data['questions']]
+        while data['next_cursor'] is not None:
+            res = self.client().get('/api/v1/questions?cursor={}'.format(data['next_cursor']))
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('total_questions', data)
+            ids += [question['id'] for question in data['questions']]
+
+        self.assertEqual(ids, sorted(set(ids)))
+
+        res = self.client().get('/api/v1/questions')
+        self.assertEqual(len(ids), json.loads(res.data)['total_questions'])
+
+    def test_400_get_questions_cursor(self):
+        """Test list questions endpoint with an invalid cursor """
+        res = self.client().get('/api/v1/questions?cursor=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['status'], 'failed')
+
     def test_get_categories(self):
         """Test list categories endpoint """
         res = self.client().get('/api/v1/categories')
@@ -53,6 +87,50 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['status'], 'success')
 
+    def test_get_categories_not_modified(self):
+        """Test list categories endpoint with a conditional request """
+        res = self.client().get('/api/v1/categories')
+        self.assertEqual(res.status_code, 200)
+        etag = res.headers['ETag']
+        self.assertTrue(etag)
+
+        res = self.client().get('/api/v1/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        res = self.client().get('/api/v1/categories', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['status'], 'success')
+
+    def test_get_categories_after_commit(self):
+        """Test a category write changes the cached catalogue once it is committed """
+        def etag():
+            res = self.client().get('/api/v1/categories')
+            self.assertEqual(res.status_code, 200)
+            return res.headers['ETag']
+
+        with self.app.app_context():
+            # a session of its own, the requests use another connection
+            session = db.session.session_factory()
+            category = Category('Unittest category')
+            try:
+                before = etag()
+                session.add(category)
+                session.flush()
+                self.assertEqual(etag(), before)
+                session.rollback()
+                self.assertEqual(etag(), before)
+
+                session.add(category)
+                session.flush()
+                self.assertEqual(etag(), before)
+                session.commit()
+                self.assertNotEqual(etag(), before)
+            finally:
+                session.delete(category)
+                session.commit()
+                session.close()
+
     def test_405_get_categories(self):
         """Test list categories Error handling endpoint """
         res = self.client().put('/api/v1/categories')
@@ -78,6 +156,24 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(after_insertion_questions['total_questions'], questions['total_questions'] + 1)
 
+    def test_create_question_write_behind(self):
+        """Test create question endpoint in write-behind mode """
+        app = create_app({'QUESTIONS_WRITE_BEHIND': True})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+
+        for i in range(3):
+            res = client.post("/api/v1/questions", json={'question': 'WriteBehindUnittest {}'.format(i), 'answer': 'Unittest answer', 'category': 1, 'difficulty': 1 } )
+            self.assertEqual(res.status_code, 202)
+            self.assertEqual(json.loads(res.data)['status'], 'success')
+
+        res = client.post("/api/v1/questions", json={'question': 'WriteBehindUnittest', 'answer': 'Unittest answer', 'category': 1000, 'difficulty': 1 } )
+        self.assertEqual(res.status_code, 422)
+
+        app.extensions['question_writer'].flush()
+        res = client.post("/api/v1/questions/search", json={'searchTerm': 'WriteBehindUnittest' } )
+        self.assertGreaterEqual(json.loads(res.data)['total_questions'], 3)
+
     def test_422_create_question(self):
         """Test create question Error handling endpoint """
 
@@ -176,6 +272,24 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['status'], 'success')
         self.assertTrue(data['question'])
 
+    def test_play_quiz_whole_category(self):
+        """Test Playing quiz endpoint until the category runs out of questions """
+        with self.app.app_context():
+            total = Question.query.filter(Question.category == 1).count()
+        previous_questions = []
+        for _ in range(total):
+            res = self.client().post('/api/v1/quizzes', json={ 'previous_questions': previous_questions, 'quiz_category': {'id': 1} })
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['question']['category'], 1)
+            self.assertNotIn(data['question']['id'], previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        res = self.client().post('/api/v1/quizzes', json={ 'previous_questions': previous_questions, 'quiz_category': {'id': 1} })
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], None)
+
     def test_400_play_quiz(self):
         """Test list categories Bad request endpoint """
         res = self.client().post('/api/v1/quizzes', json={ 'previous_questions': 'not array', 'quiz_category': 'not a dict' })
@@ -184,7 +298,244 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 400)
         self.assertEqual(data['status'], 'failed')
 
+    def test_quiz_session(self):
+        """Test playing a whole category through a quiz session """
+        with self.app.app_context():
+            total = Question.query.filter(Question.category == 1).count()
+        res = self.client().post('/api/v1/quizzes/sessions', json={ 'quiz_category': {'id': 1} })
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        session_id = data['session_id']
+
+        asked = []
+        for _ in range(total):
+            res = self.client().post('/api/v1/quizzes/sessions/{}/next'.format(session_id))
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['question']['category'], 1)
+            self.assertNotIn(data['question']['id'], asked)
+            asked.append(data['question']['id'])
+            self.assertEqual(data['questions_asked'], len(asked))
+
+        res = self.client().post('/api/v1/quizzes/sessions/{}/next'.format(session_id))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], None)
+
+        res = self.client().delete('/api/v1/quizzes/sessions/{}'.format(session_id))
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/api/v1/quizzes/sessions/{}/next'.format(session_id))
+        self.assertEqual(res.status_code, 404)
+
+    def test_400_quiz_session(self):
+        """Test creating a quiz session without a category """
+        res = self.client().post('/api/v1/quizzes/sessions', json={ 'quiz_category': 'not a dict' })
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['status'], 'failed')
+
+        res = self.client().delete('/api/v1/quizzes/sessions/unknown')
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_session_stores(self):
+        """Test the quiz session stores keep and expire sessions """
+        class Redis:
+            """the get, set and delete commands of a redis client """
+            def __init__(self):
+                self.values = {}
+
+            def get(self, key):
+                return self.values.get(key)
+
+            def set(self, key, value, ex=None):
+                self.values[key] = value
+
+            def delete(self, key):
+                return int(self.values.pop(key, None) is not None)
+
+        for store in (MemorySessionStore(ttl=60), RedisSessionStore(Redis(), ttl=60)):
+            session_id = store.create(QuizSession(2))
+            session = store.get(session_id)
+            session.seen.update([5, 3, 1000000])
+            store.save(session_id, session)
+            session = store.get(session_id)
+            self.assertEqual((session.category, session.seen), (2, {3, 5, 1000000}))
+            self.assertTrue(store.delete(session_id))
+            self.assertIsNone(store.get(session_id))
+
+        store = MemorySessionStore(ttl=0)
+        self.assertIsNone(store.get(store.create(QuizSession(0))))
+        store.create(QuizSession(0))
+        # the expired sessions are swept
+        self.assertEqual(len(store), 1)
+
+    def test_count_cache_is_bounded(self):
+        """Test the search counts keep the most recently used terms only """
+        counts = CountCache(ttl=60, maxsize=2)
+        counts.store(('search', 'a'), 1)
+        counts.store(('search', 'b'), 2)
+        self.assertEqual(counts.cached(('search', 'a')), 1)
+        counts.store(('search', 'c'), 3)
+
+        self.assertEqual(len(counts), 2)
+        self.assertIsNone(counts.cached(('search', 'b')))
+        self.assertEqual(counts.cached(('search', 'a')), 1)
+
+        counts = CountCache(ttl=0)
+        counts.store(('search', 'a'), 1)
+        self.assertIsNone(counts.cached(('search', 'a')))
+        # expired counts are dropped when read
+        self.assertEqual(len(counts), 0)
+
+    def test_create_app_does_not_query(self):
+        """Test the application starts without talking to the database """
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(Engine, 'before_cursor_execute', listener)
+        try:
+            app = create_app()
+            setup_db(app, self.database_path)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+
+    def test_create_db_command(self):
+        """Test the create-db command """
+        result = self.app.test_cli_runner().invoke(args=['create-db'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Created', result.output)
+
+    def test_metrics(self):
+        """Test the request metrics endpoint """
+        app = create_app({'METRICS_N_PLUS_ONE_THRESHOLD': 1})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        res = client.get('/api/v1/questions')
+        self.assertEqual(res.status_code, 200)
+
+        res = client.get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        text = res.data.decode()
+        self.assertIn('http_request_duration_seconds_count{endpoint="get_questions",method="GET"} 1', text)
+        self.assertIn('http_requests_total{endpoint="get_questions",method="GET",status="200"} 1', text)
+        self.assertIn('http_request_sql_statements_total{endpoint="get_questions"}', text)
+        # every statement counts as repeated with a threshold of 1
+        self.assertIn('http_request_n_plus_one_total{endpoint="get_questions"} 1', text)
+
+        res = client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(res.status_code, 404)
+
+    def test_metrics_sql_rows_and_errors(self):
+        """Test the SQL metrics count returned rows only and survive failed statements """
+        app = create_app()
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        with app.app_context():
+            question = Question(question='Metrics question', answer='a', category=1, difficulty=1)
+            question.insert()
+            question_id = question.id
+        res = client.delete('/api/v1/questions/{}'.format(question_id))
+        self.assertEqual(res.status_code, 200)
 
+        text = client.get('/metrics').data.decode()
+        # the deleted row is changed, not returned
+        self.assertIn('http_request_sql_rows_total{endpoint="delete_question"} 0', text)
+
+        with app.test_request_context():
+            connection = db.session.connection()
+            with self.assertRaises(Exception):
+                db.session.execute('SELECT * FROM missing_table')
+            self.assertEqual(connection.info.get('request_sql_started'), [])
+            db.session.rollback()
+
+    def test_read_replica(self):
+        """Test reads go to the replica until the client writes """
+        replica_path = 'sqlite:///{}'.format(os.path.join(tempfile.mkdtemp(), 'replica.db'))
+        replica = create_engine(replica_path)
+        db.metadata.create_all(replica)
+        replica.execute(Category.__table__.insert(), {'id': 1, 'type': 'Replica'})
+        replica.execute(Question.__table__.insert(), {'question': 'ReplicaUnittest', 'answer': 'a', 'category': 1, 'difficulty': 1})
+        app = create_app({'DATABASE_REPLICA_URLS': replica_path})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+
+        def total_questions(client):
+            res = client.get('/api/v1/questions')
+            self.assertEqual(res.status_code, 200)
+            return json.loads(res.data)['total_questions']
+
+        try:
+            self.assertEqual(total_questions(client), 1)
+            res = client.post("/api/v1/questions", json={'question': 'Unittest question', 'answer': 'Unittest answer', 'category': 1, 'difficulty': 1 } )
+            self.assertEqual(res.status_code, 200)
+            # the client reads its own write from the primary
+            self.assertGreater(total_questions(client), 1)
+            # other clients still read from the replica
+            self.assertEqual(total_questions(app.test_client()), 1)
+        finally:
+            # the categories may have been cached from the replica
+            category_cache.invalidate()
+
+    def test_asgi(self):
+        """Test the ASGI app answers like the Flask app """
+        from flaskr.asgi import create_app as create_asgi_app
+        asgi_app = create_asgi_app(self.database_path)
+        requests = [
+            ('GET', '/api/v1/categories', b''),
+            ('GET', '/api/v1/questions?page=1', b''),
+            ('GET', '/api/v1/questions?cursor=&count=exact', b''),
+            ('GET', '/api/v1/categories/1/questions', b''),
+            ('POST', '/api/v1/questions/search', b'{"searchTerm": "title"}'),
+            ('POST', '/api/v1/quizzes', b'{"previous_questions": []}'),
+            ('POST', '/api/v1/quizzes/sessions', b'{"quiz_category": 1}'),
+            ('POST', '/api/v1/quizzes/sessions/unknown/next', b''),
+            ('DELETE', '/api/v1/quizzes/sessions/unknown', b''),
+            ('GET', '/api/v1/questions?cursor=invalid', b''),
+            ('PUT', '/api/v1/questions', b''),
+            ('DELETE', '/api/v1/questions/1000000', b'')
+        ]
+
+        async def request(method, path, body):
+            path, _, query = path.partition('?')
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'headers': []}
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await asgi_app(scope, receive, send)
+            return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+        async def responses(requests):
+            await asgi_app.router.startup()
+            try:
+                return [await request(*arguments) for arguments in requests]
+            finally:
+                await asgi_app.router.shutdown()
+
+        for (method, path, body), response in zip(requests, asyncio.run(responses(requests))):
+            res = self.client().open(path, method=method, data=body)
+            self.assertEqual(response, (res.status_code, res.data))
+        self.assertEqual([status for status, body in asyncio.run(responses(requests))[-7:]], [400, 400, 404, 404, 400, 405, 404])
+
+        async def quiz_session():
+            await asgi_app.router.startup()
+            try:
+                status, body = await request('POST', '/api/v1/quizzes/sessions', b'{"quiz_category": {"id": 1}}')
+                self.assertEqual(status, 200)
+                session_id = json.loads(body)['session_id']
+                status, body = await request('POST', '/api/v1/quizzes/sessions/{}/next'.format(session_id), b'')
+                self.assertEqual(status, 200)
+                self.assertEqual(json.loads(body)['questions_asked'], 1)
+                status, body = await request('DELETE', '/api/v1/quizzes/sessions/{}'.format(session_id), b'')
+                self.assertEqual(status, 200)
+            finally:
+                await asgi_app.router.shutdown()
+
+        asyncio.run(quiz_session())
 
 
 # Make the tests conveniently executable
@@ -1,21 +1,36 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, Response, stream_with_context
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, db, Drink, decode_recipe
+from fsnd_db.engine import pool_stats
 from .auth.auth import AuthError, requires_auth
+from .response_cache import ResponseCache
+from .bulk import iter_ndjson, iter_json_array, import_drinks, export_drinks, MalformedPayload
+from fsnd_db.metrics import RequestMetrics
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
+'''
+Latency, SQL statements and pool counters on /metrics, for local clients
+'''
+metrics = RequestMetrics(app, pool_stats=lambda: pool_stats(db.engine))
+
 '''
 !! NOTE THIS MUST BE UNCOMMENTED ONLY ON FIRST RUN
 '''
 # db_drop_and_create_all()
 
+'''
+Encoded bodies of the public endpoints, invalidated by every drink write.
+Install the brotli package to serve brotli variants next to the gzip ones.
+'''
+response_cache = ResponseCache(ttl=int(os.environ.get('RESPONSE_CACHE_TTL', 30)))
+
 '''
 Use the after_request decorator to set Access-Control-Allow
 '''
@@ -34,15 +49,14 @@ GET /drinks
     - contain only the drink.short() data representation
     - returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+    - served from response_cache, gzip/brotli encoded when accepted, 304 on a matching If-None-Match
 '''
 @app.route("/drinks")
 def get_short_repr_drinks():
-    drinks = Drink.query.all()
-    formatted_drinks = [drink.short() for drink in drinks]
-    return jsonify({
+    return response_cache.respond('drinks', lambda: json.dumps({
       'status': True,
-      'drinks': formatted_drinks
-    })
+      'drinks': Drink.all_short()
+    }, separators=(',', ':')).encode('utf-8'), request)
 
 '''
     GET /drinks-detail
@@ -54,11 +68,9 @@ def get_short_repr_drinks():
 @app.route("/drinks-detail")
 @requires_auth('get:drinks-detail')
 def get_long_repr_drinks():
-    drinks = Drink.query.all()
-    formatted_drinks = [drink.long() for drink in drinks]
     return jsonify({
       'status': True,
-      'drinks': formatted_drinks
+      'drinks': Drink.all_long()
     })
 
 '''
@@ -86,6 +98,7 @@ def create_drink():
                 abort(422)
         drink = Drink(title=title, recipe=json.dumps(recipe))
         drink.insert()
+        response_cache.invalidate()
         return jsonify({
             'status': True,
             'drinks': [drink.long()],
@@ -93,6 +106,56 @@ def create_drink():
     except:
         abort(422)
 
+'''
+    POST /drinks/bulk
+        - it should require the 'post:drinks' permission
+        - the body is a json array of drinks, or one drink per line when sent as application/x-ndjson
+        - the body is parsed while it is read and valid drinks are inserted in chunks, one transaction per chunk
+    returns status code 200 and json {"success": True, "inserted": n, "error_count": n, "errors": errors}
+        where errors lists the rejected drinks as {"row": position in the payload, "error": reason}
+    returns status code 400 with the same counts when the json array is malformed, the drinks read
+        before the error are inserted
+'''
+@app.route("/drinks/bulk", methods=['POST'])
+@requires_auth('post:drinks')
+def bulk_create_drinks():
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        documents = iter_ndjson(request.stream)
+    else:
+        documents = iter_json_array(request.stream)
+    try:
+        inserted, error_count, errors = import_drinks(documents, on_commit=response_cache.invalidate)
+    except MalformedPayload as e:
+        inserted, error_count, errors = e.result
+        return jsonify({
+            'success': False,
+            'error': 400,
+            'message': 'Malformed json: {}'.format(e),
+            'inserted': inserted,
+            'error_count': error_count,
+            'errors': errors
+        }), 400
+    return jsonify({
+        'success': True,
+        'inserted': inserted,
+        'error_count': error_count,
+        'errors': errors
+    })
+
+'''
+    GET /drinks/export
+        - it should require the 'get:drinks-detail' permission
+        - streams the drink.long() data representation of every drink, one drink per line (ndjson)
+          or as a json array with ?format=json, without loading the whole table
+'''
+@app.route("/drinks/export")
+@requires_auth('get:drinks-detail')
+def export_drinks_stream():
+    as_array = request.args.get('format', 'ndjson') == 'json'
+    return Response(
+        stream_with_context(export_drinks(as_array=as_array)),
+        mimetype='application/json' if as_array else 'application/x-ndjson')
+
 '''
     PATCH /drinks/<id>
         where <id> is the existing model id
@@ -113,7 +176,7 @@ def update_drink(drink_id):
         abort(404)
 
     title = data.get('title', drink.title)
-    recipe = data.get('recipe', json.loads(drink.recipe))
+    recipe = data.get('recipe', decode_recipe(drink.recipe)[1])
     if type(recipe) != list:
         abort(422)
     for item in recipe:
@@ -128,6 +191,7 @@ def update_drink(drink_id):
     drink.recipe = json.dumps(recipe)
 
     drink.update()
+    response_cache.invalidate()
     return jsonify({
         'status': True,
         'drinks': [drink.long()],
@@ -152,6 +216,7 @@ def delete_drink(drink_id):
             abort(404)
 
         drink.delete()
+        response_cache.invalidate()
 
         return jsonify({
         'status': True,
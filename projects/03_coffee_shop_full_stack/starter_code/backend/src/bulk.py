@@ -0,0 +1,251 @@
+import codecs
+import json
+from sqlalchemy import exc
+
+from .database.models import db, Drink
+
+
+CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+
+
+'''
+MalformedPayload
+    raised when the body can not be parsed any further
+'''
+class MalformedPayload(ValueError):
+    pass
+
+
+'''
+iter_ndjson(stream)
+    yields the decoded document of every non empty line of a binary stream,
+    or a MalformedPayload for a line which is not valid json
+'''
+def iter_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield MalformedPayload(str(e))
+
+
+# what iter_json_array expects next
+ARRAY_START, FIRST_ITEM, ITEM, SEPARATOR, ARRAY_END = range(5)
+
+
+'''
+iter_json_array(stream)
+    yields the items of a json array read from a binary stream chunk by chunk,
+    so only the item being decoded is held in memory
+    raises MalformedPayload when the array is not valid json: items must be
+    separated by exactly one comma and only whitespace may follow the array
+'''
+def iter_json_array(stream, read_size=READ_SIZE):
+    decoder = json.JSONDecoder()
+    # a multi byte character may be split between two reads
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    expected = ARRAY_START
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position < len(buffer):
+            char = buffer[position]
+            if expected == ARRAY_START:
+                if char != '[':
+                    raise MalformedPayload('Expected a json array.')
+                expected = FIRST_ITEM
+                position += 1
+                continue
+            if expected == ARRAY_END:
+                raise MalformedPayload('Extra data after the json array.')
+            if char == ']' and expected in (FIRST_ITEM, SEPARATOR):
+                expected = ARRAY_END
+                position += 1
+                continue
+            if expected == SEPARATOR:
+                if char != ',':
+                    raise MalformedPayload('Expected , or ] after an item.')
+                expected = ITEM
+                position += 1
+                continue
+            if char in ',]':
+                raise MalformedPayload('Expected an item, got {}.'.format(char))
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError as e:
+                if eof:
+                    raise MalformedPayload(str(e))
+            else:
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    yield item
+                    position = end
+                    expected = SEPARATOR
+                    continue
+        if eof:
+            if expected == ARRAY_END:
+                return
+            raise MalformedPayload('Unterminated json array.')
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+        try:
+            buffer = buffer[position:] + text.decode(chunk, final=eof)
+        except UnicodeDecodeError as e:
+            raise MalformedPayload(str(e))
+        position = 0
+
+
+'''
+validate_drink(data)
+    returns the (title, recipe) of a drink document
+    raises ValueError describing the first invalid field
+'''
+def validate_drink(data):
+    if not isinstance(data, dict):
+        raise ValueError('A drink must be an object.')
+    title = data.get('title')
+    recipe = data.get('recipe')
+    if not isinstance(title, str) or not title or len(title) > 80:
+        raise ValueError('title must be a non empty string of at most 80 characters.')
+    if not isinstance(recipe, list) or not recipe:
+        raise ValueError('recipe must be a non empty list.')
+    for item in recipe:
+        if not isinstance(item, dict) or None in [item.get('color'), item.get('name'), item.get('parts')]:
+            raise ValueError('every recipe item needs a color, a name and parts.')
+    encoded = json.dumps(recipe)
+    if len(encoded) > 180:
+        raise ValueError('recipe is too long.')
+    return title, encoded
+
+
+'''
+import_drinks(documents)
+    validates the drink documents and inserts the valid ones in chunks of
+    chunk_size rows, one transaction per chunk
+    a title which already exists is reported, a chunk failing on insert is
+    retried row by row so only the offending rows are reported
+    on_commit() is called after every committed chunk
+    returns (inserted, error_count, errors), errors is a list of the first
+    MAX_REPORTED_ERRORS {'row', 'error'} dicts, row is the 0 based position
+    of the drink in the payload
+    raises MalformedPayload, with this tuple as its result attribute, when
+    the payload can not be parsed further, once the drinks read before the
+    error are imported
+'''
+def import_drinks(documents, chunk_size=CHUNK_SIZE, on_commit=None):
+    inserted = 0
+    errors = []
+    error_count = 0
+
+    def report(row, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': row, 'error': message})
+
+    def flush(chunk):
+        titles = [values['title'] for _, values in chunk]
+        existing = {title for title, in db.session.query(Drink.title).filter(Drink.title.in_(titles))}
+        rows = []
+        for row, values in chunk:
+            if values['title'] in existing:
+                report(row, 'A drink with this title already exists.')
+            else:
+                rows.append((row, values))
+        if not rows:
+            return 0
+        try:
+            db.session.execute(Drink.__table__.insert(), [values for _, values in rows])
+            db.session.commit()
+            return len(rows)
+        except exc.IntegrityError:
+            db.session.rollback()
+        count = 0
+        for row, values in rows:
+            try:
+                db.session.execute(Drink.__table__.insert(), values)
+                db.session.commit()
+                count += 1
+            except exc.IntegrityError:
+                db.session.rollback()
+                report(row, 'A drink with this title already exists.')
+        return count
+
+    chunk = []
+    seen = set()
+    try:
+        for row, document in enumerate(documents):
+            if isinstance(document, MalformedPayload):
+                report(row, 'Malformed json: {}'.format(document))
+                continue
+            try:
+                title, recipe = validate_drink(document)
+            except ValueError as e:
+                report(row, str(e))
+                continue
+            if title in seen:
+                report(row, 'Duplicate title in the payload.')
+                continue
+            seen.add(title)
+            chunk.append((row, {'title': title, 'recipe': recipe}))
+            if len(chunk) >= chunk_size:
+                inserted += flush(chunk)
+                chunk = []
+                if on_commit is not None:
+                    on_commit()
+    except MalformedPayload as e:
+        # the drinks read before the error are kept, the error carries
+        # the counts of what was imported
+        report(None, 'Malformed json: {}'.format(e))
+        malformed = e
+    else:
+        malformed = None
+    if chunk:
+        inserted += flush(chunk)
+        if on_commit is not None:
+            on_commit()
+    if malformed is not None:
+        malformed.result = (inserted, error_count, errors)
+        raise malformed
+    return inserted, error_count, errors
+
+
+'''
+export_drinks(batch_size, as_array)
+    yields the long representation of every drink as json text, one line per
+    drink (ndjson) or as a json array, reading batch_size rows per query
+    seeking on the id, so the table is never loaded at once
+'''
+def export_drinks(batch_size=CHUNK_SIZE, as_array=False):
+    last_id = 0
+    first = True
+    while True:
+        rows = db.session.query(Drink.id, Drink.title, Drink.recipe)\
+            .filter(Drink.id > last_id)\
+            .order_by(Drink.id)\
+            .limit(batch_size)\
+            .all()
+        if not rows:
+            break
+        lines = []
+        for row in rows:
+            # the stored recipe is already json text, it is written as is
+            line = '{{"id":{},"title":{},"recipe":{}}}'.format(row.id, json.dumps(row.title), row.recipe)
+            if as_array:
+                lines.append(('[' if first else ',') + line)
+            else:
+                lines.append(line + '\n')
+            first = False
+        last_id = rows[-1].id
+        yield ''.join(lines)
+    if as_array:
+        yield '[]' if first else ']'
@@ -1,13 +1,16 @@
 import os
+from contextlib import contextmanager
 from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_db.engine import engine_options
+from fsnd_db.routing import RoutingSQLAlchemy
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
@@ -16,6 +19,7 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
 
@@ -29,6 +33,82 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+unit_of_work()
+    stages the changes of every insert(), update() and delete() call made
+    inside the block and commits them once when it exits, or rolls them
+    all back when it raises. blocks can be nested, the outermost commits.
+    EXAMPLE
+        with unit_of_work():
+            for drink in drinks:
+                drink.insert()
+'''
+@contextmanager
+def unit_of_work():
+    depth = db.session.info.get('unit_of_work', 0)
+    db.session.info['unit_of_work'] = depth + 1
+    try:
+        yield db.session
+        if depth == 0:
+            db.session.commit()
+    except BaseException:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        db.session.info['unit_of_work'] = depth
+
+'''
+commit()
+    commits the session, or only flushes it inside a unit_of_work so
+    the ids are assigned and the commit is left to the block
+'''
+def commit():
+    if db.session.info.get('unit_of_work'):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+'''
+decode_recipe(recipe)
+    decodes a recipe json blob into its short and long projections
+'''
+def decode_recipe(recipe):
+    long_recipe = json.loads(recipe)
+    short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in long_recipe]
+    return short_recipe, long_recipe
+
+'''
+RecipeCache
+    decoded short and long projections of every drink, keyed by drink id,
+    so each stored recipe is parsed once whatever the number of drinks.
+    an entry holds the blob it was decoded from and is decoded again when
+    the row read carries another blob, e.g. after a change made by another
+    process. insert(), update() and delete() drop the entry of their drink.
+    the projections are shared between calls and must be treated as read only
+'''
+class RecipeCache:
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, drink_id, recipe):
+        entry = self._entries.get(drink_id)
+        if entry is None or entry[0] != recipe:
+            entry = (recipe,) + decode_recipe(recipe)
+            self._entries[drink_id] = entry
+        return entry[1], entry[2]
+
+    def discard(self, drink_id):
+        self._entries.pop(drink_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+recipe_cache = RecipeCache()
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -47,12 +127,10 @@ class Drink(db.Model):
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': recipe_cache.get(self.id, self.recipe)[0]
         }
 
     '''
@@ -63,9 +141,31 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': recipe_cache.get(self.id, self.recipe)[1]
         }
 
+    '''
+    all_short() / all_long()
+        short and long form representations of every drink, ordered by id
+        reads plain (id, title, recipe) rows instead of building Drink instances
+    '''
+    @classmethod
+    def all_short(cls):
+        return cls._all_projections(0)
+
+    @classmethod
+    def all_long(cls):
+        return cls._all_projections(1)
+
+    @classmethod
+    def _all_projections(cls, form):
+        rows = db.session.query(cls.id, cls.title, cls.recipe).order_by(cls.id)
+        return [{
+            'id': row.id,
+            'title': row.title,
+            'recipe': recipe_cache.get(row.id, row.recipe)[form]
+        } for row in rows]
+
     '''
     insert()
         inserts a new model into a database
@@ -77,7 +177,8 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
+        recipe_cache.discard(self.id)
 
     '''
     delete()
@@ -89,7 +190,8 @@ class Drink(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit()
+        recipe_cache.discard(self.id)
 
     '''
     update()
@@ -101,7 +203,8 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
-        db.session.commit()
+        commit()
+        recipe_cache.discard(self.id)
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
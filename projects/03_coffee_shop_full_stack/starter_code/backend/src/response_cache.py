@@ -0,0 +1,102 @@
+import gzip
+import hashlib
+import threading
+import time
+from flask import current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+'''
+CachedBody
+    an encoded response body and its compressed variants
+    a variant is compressed the first time a client accepts its coding
+'''
+class CachedBody:
+    compressors = {'gzip': lambda body: gzip.compress(body, 6)}
+    if brotli is not None:
+        compressors['br'] = brotli.compress
+
+    def __init__(self, body, min_compress_size):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.compressible = len(body) >= min_compress_size
+        self._variants = {}
+
+    '''
+    variant(coding)
+        returns (body, etag) of the coding (gzip, br)
+    '''
+    def variant(self, coding):
+        variant = self._variants.get(coding)
+        if variant is None:
+            variant = (self.compressors[coding](self.body), '{}-{}'.format(self.etag, coding))
+            self._variants[coding] = variant
+        return variant
+
+
+'''
+ResponseCache
+    encoded bodies of public responses which are the same for every caller
+
+    a body is built on first use, compressed at most once per coding with
+    gzip (and brotli when the brotli package is installed), and kept until
+    invalidate() is called or `ttl` seconds passed so writes made by other
+    processes show up as well.
+    responses carry a strong ETag per variant so conditional requests get 304s.
+'''
+class ResponseCache:
+    def __init__(self, ttl=30, min_compress_size=1024):
+        self.ttl = ttl
+        self.min_compress_size = min_compress_size
+        self.version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    '''
+    get(key, build)
+        returns the CachedBody of key, build() returns the bytes of the body
+    '''
+    def get(self, key, build):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        version = self.version
+        cached = CachedBody(build(), self.min_compress_size)
+        with self._lock:
+            # a write committed while building makes this body stale, don't keep it
+            if self.version == version:
+                self._entries[key] = (cached, time.monotonic() + self.ttl)
+        return cached
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    '''
+    respond(key, build, request, mimetype)
+        the response of key, in the best coding the client accepts,
+        or an empty 304 when If-None-Match holds its ETag
+    '''
+    def respond(self, key, build, request, mimetype='application/json'):
+        cached = self.get(key, build)
+        body, etag, coding = cached.body, cached.etag, None
+        if cached.compressible:
+            for candidate in ('br', 'gzip'):
+                if candidate in cached.compressors and request.accept_encodings[candidate]:
+                    coding = candidate
+                    body, etag = cached.variant(candidate)
+                    break
+
+        response = current_app.response_class(body, mimetype=mimetype)
+        if coding is not None:
+            response.headers['Content-Encoding'] = coding
+        if cached.compressible:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,175 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from src.database import models
+
+# the application binds its database when src.api is imported
+database_dir = tempfile.mkdtemp()
+models.database_path = 'sqlite:///{}'.format(os.path.join(database_dir, 'test.db'))
+
+from src.api import app
+from src.auth.auth import VerifiedPayload, token_cache
+from src.bulk import iter_json_array, iter_ndjson, MalformedPayload
+from src.database.models import db, Drink
+
+TOKEN = 'bulk-test-token'
+RECIPE = [{'color': 'blue', 'name': 'water', 'parts': 1}]
+
+
+def drink(title):
+    return {'title': title, 'recipe': RECIPE}
+
+
+class JsonArrayTestCase(unittest.TestCase):
+    """This class represents the streamed json array parser test case"""
+
+    def parse(self, body, read_size=3):
+        return list(iter_json_array(io.BytesIO(body.encode('utf-8')), read_size=read_size))
+
+    def test_valid_arrays(self):
+        """Test items are read across chunk boundaries """
+        self.assertEqual(self.parse('[]'), [])
+        self.assertEqual(self.parse(' [ ] \n'), [])
+        self.assertEqual(self.parse('[1, 22, 333]'), [1, 22, 333])
+        self.assertEqual(self.parse('[12345678]', read_size=2), [12345678])
+        self.assertEqual(
+            self.parse('[{"title": "café"}, "été", [true, null]]'),
+            [{'title': 'café'}, 'été', [True, None]]
+        )
+
+    def test_malformed_arrays(self):
+        """Test separators are enforced and trailing data is rejected """
+        for body in ('', '{}', '[1 2]', '[,1]', '[,,1]', '[1,,2]', '[1,]',
+                     '[1', '[1,', '[1] 2', '[1]]', '[1][2]', '[1, tru]',
+                     '["a]'):
+            with self.subTest(body=body):
+                with self.assertRaises(MalformedPayload):
+                    self.parse(body)
+
+    def test_invalid_utf8(self):
+        """Test a body which is not utf-8 is malformed """
+        with self.assertRaises(MalformedPayload):
+            list(iter_json_array(io.BytesIO(b'["\xff"]')))
+
+
+class NdjsonTestCase(unittest.TestCase):
+    """This class represents the ndjson parser test case"""
+
+    def test_lines(self):
+        """Test every non empty line is a document """
+        documents = list(iter_ndjson(io.BytesIO(b'{"a": 1}\n\n[2]\r\n3')))
+
+        self.assertEqual(documents, [{'a': 1}, [2], 3])
+
+    def test_malformed_line(self):
+        """Test an invalid line does not stop the following ones """
+        documents = list(iter_ndjson(io.BytesIO(b'{"a": 1}\n{"a"\n{"a": 2}\n')))
+
+        self.assertEqual(documents[0], {'a': 1})
+        self.assertIsInstance(documents[1], MalformedPayload)
+        self.assertEqual(documents[2], {'a': 2})
+
+
+class BulkEndpointsTestCase(unittest.TestCase):
+    """This class represents the bulk import and export endpoints test case"""
+
+    def setUp(self):
+        self.client = app.test_client()
+        token_cache.set(TOKEN, VerifiedPayload({
+            'exp': time.time() + 600,
+            'permissions': ['post:drinks', 'get:drinks-detail']
+        }))
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+
+    def tearDown(self):
+        token_cache.clear()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post(
+            '/drinks/bulk',
+            data=body,
+            content_type=content_type,
+            headers={'Authorization': 'Bearer ' + TOKEN}
+        )
+
+    def titles(self):
+        with app.app_context():
+            return [title for title, in db.session.query(Drink.title).order_by(Drink.id)]
+
+    def test_import_json_array(self):
+        """Test the drinks of a json array are inserted """
+        res = self.post(json.dumps([drink('tea'), drink('coffee'), {'title': 'milk'}]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['error_count'], 1)
+        self.assertEqual(data['errors'][0]['row'], 2)
+        self.assertEqual(self.titles(), ['tea', 'coffee'])
+
+    def test_import_ndjson(self):
+        """Test the drinks of an ndjson body are inserted line by line """
+        body = '\n'.join([json.dumps(drink('tea')), '{"title"', json.dumps(drink('tea'))])
+        res = self.post(body, 'application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual([error['row'] for error in data['errors']], [1, 2])
+        self.assertEqual(self.titles(), ['tea'])
+
+    def test_400_import_malformed_json_array(self):
+        """Test a malformed array is a 400 reporting the drinks read before the error """
+        res = self.post('[{}, {}] {}'.format(json.dumps(drink('tea')), json.dumps(drink('coffee')), '[]'))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['errors'][-1]['row'], None)
+
+        res = self.post('[{} {}]'.format(json.dumps(drink('milk')), json.dumps(drink('juice'))))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.titles(), ['tea', 'coffee', 'milk'])
+
+    def test_export(self):
+        """Test the export streams every drink and can be imported again """
+        self.post(json.dumps([drink('drink {}'.format(i)) for i in range(1200)]))
+
+        res = self.client.get('/drinks/export', headers={'Authorization': 'Bearer ' + TOKEN})
+        lines = res.data.decode('utf-8').splitlines()
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), 1200)
+        self.assertEqual(json.loads(lines[0])['recipe'], RECIPE)
+
+        res = self.client.get('/drinks/export?format=json', headers={'Authorization': 'Bearer ' + TOKEN})
+        exported = json.loads(res.data)
+        self.assertEqual([item['title'] for item in exported], self.titles())
+
+        with app.app_context():
+            db.session.query(Drink).delete()
+            db.session.commit()
+        res = self.post(json.dumps([{'title': item['title'], 'recipe': item['recipe']} for item in exported]))
+        self.assertEqual(json.loads(res.data)['inserted'], 1200)
+
+    def test_export_empty_table(self):
+        """Test an empty table exports an empty array """
+        res = self.client.get('/drinks/export?format=json', headers={'Authorization': 'Bearer ' + TOKEN})
+
+        self.assertEqual(json.loads(res.data), [])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 import os
+from datetime import datetime
 from flask import (
+  Blueprint,
   Flask,
   request,
   jsonify,
@@ -7,28 +9,144 @@ from flask import (
 )
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy.orm import selectinload
 import json
 from models import (
+    db,
     db_drop_and_create_all,
     setup_db,
     Actor,
-    Movie
+    Movie,
+    movie_cast,
+    actor_filmography,
+    assign_actors
 )
 from auth.auth import AuthError, requires_auth
+from fsnd_db.engine import pool_stats
+from fsnd_db.metrics import RequestMetrics
+
+
+api = Blueprint('api', __name__)
 
 
 def create_app(test_config=None):
-    # create and configure the app
+    # create and configure the app, nothing is sent to the database
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.update(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI'))
     CORS(app)
+    app.register_blueprint(api)
+    RequestMetrics(app, pool_stats=lambda: pool_stats(db.engine))
 
     return app
 
 
-app = create_app()
-
 DATA_PER_PAGE = 10
+MAX_PER_PAGE = 100
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y')
+MAX_AGE = 150
+
+
+'''
+include_options(model, allowed)
+    reads the ?include= argument (comma separated relationship names)
+    aborts with 400 when a name is not one of allowed
+    returns the loader options of the query and the included names,
+    each included collection is loaded by one extra SELECT ... IN query
+    for the whole page, nothing is loaded when include is not given
+'''
+
+
+def include_options(model, allowed):
+    include = {
+        name for name in request.args.get('include', '').split(',') if name
+    }
+    if not include <= set(allowed):
+        abort(400)
+    options = [selectinload(getattr(model, name)) for name in sorted(include)]
+    return options, include
+
+
+'''
+keyset_args()
+    reads the ?after= (last id of the previous page) and ?limit= arguments
+    of the cast endpoints, aborts with 400 when they are not valid
+'''
+
+
+def keyset_args():
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', DATA_PER_PAGE, type=int)
+    if after < 0 or not 0 < limit <= MAX_PER_PAGE:
+        abort(400)
+    return after, limit
+
+
+'''
+parse_date(value) / parse_age(value)
+    typed values of the release_date and age fields, release dates are
+    accepted as YYYY-MM-DD or MM/DD/YYYY strings, ages as integers or
+    digit strings, raise ValueError otherwise
+'''
+
+
+def parse_date(value):
+    if isinstance(value, str):
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value.strip(), date_format).date()
+            except ValueError:
+                continue
+    raise ValueError('invalid date: {!r}'.format(value))
+
+
+def parse_age(value):
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if type(value) is not int or not 0 <= value <= MAX_AGE:
+        raise ValueError('invalid age: {!r}'.format(value))
+    return value
+
+
+'''
+query_filter(name, parse)
+    the parsed value of the ?name= argument, None when it is not given
+    aborts with 400 when it can not be parsed
+'''
+
+
+def query_filter(name, parse):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        abort(400)
+
+
+'''
+sort_order(model, columns)
+    order_by clauses of the ?sort= argument, the name of one of columns,
+    prefixed with '-' for a descending order, rows sharing a value are
+    ordered by id. aborts with 400 on an unknown column
+'''
+
+
+def sort_order(model, columns):
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    name = sort[1:] if descending else sort
+    if name != 'id' and name not in columns:
+        abort(400)
+    order = [getattr(model, name), model.id] if name != 'id' else [model.id]
+    return [column.desc() if descending else column.asc() for column in order]
+
+
+def exists_or_404(model, id):
+    if db.session.query(model.id).filter(model.id == id).scalar() is None:
+        abort(404)
 
 
 '''
@@ -41,7 +159,7 @@ Use the after_request decorator to set Access-Control-Allow
 '''
 
 
-@app.after_request
+@api.after_app_request
 def after_request(response):
     response.headers['Access-Control-Allow-Origin'] = 'http://localhost:4200'
     response.headers['Access-Control-Allow-Headers']\
@@ -57,18 +175,31 @@ def after_request(response):
 GET /movies
     - public endpoint
     - contain only the movie.short() data representation
+    - ?include=actors adds the cast of every movie
+    - ?released_after=YYYY-MM-DD and ?released_before=YYYY-MM-DD filter on
+        the release date, ?sort=id|title|release_date (- prefix for
+        descending) orders the movies, both are answered by indexes
     - returns status code 200 and json {"success": True, "movies": movies}
         where movies is the list of movies
         or appropriate status code indicating reason for failure
 '''
 
 
-@app.route("/api/v1/movies")
+@api.route("/api/v1/movies")
 @requires_auth('view:movies')
 def get_long_repr_movies():
     page = request.args.get('page', 1, type=int)
-    movies = Movie.query.paginate(page, DATA_PER_PAGE, False)
-    formatted_movies = [movie.format() for movie in movies.items]
+    options, include = include_options(Movie, ('actors',))
+    query = Movie.query.options(*options)
+    released_after = query_filter('released_after', parse_date)
+    if released_after is not None:
+        query = query.filter(Movie.release_date > released_after)
+    released_before = query_filter('released_before', parse_date)
+    if released_before is not None:
+        query = query.filter(Movie.release_date < released_before)
+    movies = query.order_by(*sort_order(Movie, ('title', 'release_date')))\
+        .paginate(page, DATA_PER_PAGE, False)
+    formatted_movies = [movie.format(include) for movie in movies.items]
     return jsonify({
       'status': True,
       'movies': formatted_movies,
@@ -87,7 +218,7 @@ def get_long_repr_movies():
 '''
 
 
-@app.route("/api/v1/movies", methods=['POST'])
+@api.route("/api/v1/movies", methods=['POST'])
 @requires_auth('create:movies')
 def create_movie():
     data = request.get_json(force=True)
@@ -96,7 +227,7 @@ def create_movie():
         release_date = data.get('release_date')
         if None in [title, release_date]:
             abort(422)
-        movie = Movie(title=title, release_date=release_date)
+        movie = Movie(title=title, release_date=parse_date(release_date))
         movie.insert()
         return jsonify({
             'status': True,
@@ -119,7 +250,7 @@ def create_movie():
 '''
 
 
-@app.route("/api/v1/movies/<int:movie_id>", methods=['PATCH'])
+@api.route("/api/v1/movies/<int:movie_id>", methods=['PATCH'])
 @requires_auth('patch:movies')
 def update_movie(movie_id):
     data = request.get_json(force=True)
@@ -129,7 +260,12 @@ def update_movie(movie_id):
         abort(404)
 
     title = data.get('title', movie.title)
-    release_date = data.get('release_date', movie.release_date)
+    release_date = movie.release_date
+    if 'release_date' in data:
+        try:
+            release_date = parse_date(data['release_date'])
+        except ValueError:
+            abort(422)
 
     movie.title = title
     movie.release_date = release_date
@@ -154,7 +290,7 @@ def update_movie(movie_id):
 '''
 
 
-@app.route("/api/v1/movies/<int:movie_id>", methods=['DELETE'])
+@api.route("/api/v1/movies/<int:movie_id>", methods=['DELETE'])
 @requires_auth('delete:movies')
 def delete_movie(movie_id):
     try:
@@ -173,22 +309,92 @@ def delete_movie(movie_id):
         abort(422)
 
 
+'''
+    GET /movies/<id>/actors
+        - it should require the 'view:movies' permission
+        - respond with a 404 error if <id> is not found
+        - ?after=<actor id> and ?limit= page through the cast ordered by
+          actor id
+    returns status code 200 and json {"status": True, "actors": actors,
+        "next_after": id} where next_after is the after value of the next page,
+        null on the last page
+'''
+
+
+@api.route("/api/v1/movies/<int:movie_id>/actors")
+@requires_auth('view:movies')
+def get_movie_actors(movie_id):
+    after, limit = keyset_args()
+    actors, next_after = movie_cast(movie_id, after, limit)
+    if not actors:
+        exists_or_404(Movie, movie_id)
+    return jsonify({
+        'status': True,
+        'actors': [actor.format() for actor in actors],
+        'next_after': next_after
+    })
+
+
+'''
+    POST /movies/<id>/actors
+        - it should require the 'patch:movies' permission
+        - respond with a 404 error if <id> is not found
+        - the body {"actor_ids": [ids]} adds these actors to the cast in a
+          single statement, actors already in the cast are skipped
+    returns status code 200 and json {"status": True, "added": n,
+        "unknown_actor_ids": ids}
+'''
+
+
+@api.route("/api/v1/movies/<int:movie_id>/actors", methods=['POST'])
+@requires_auth('patch:movies')
+def add_movie_actors(movie_id):
+    data = request.get_json(force=True, silent=True) or {}
+    actor_ids = data.get('actor_ids')
+    if not isinstance(actor_ids, list)\
+            or not all(type(actor_id) is int for actor_id in actor_ids):
+        abort(422)
+    exists_or_404(Movie, movie_id)
+    try:
+        added, unknown_actor_ids = assign_actors(movie_id, actor_ids)
+    except Exception:
+        db.session.rollback()
+        abort(422)
+    return jsonify({
+        'status': True,
+        'added': added,
+        'unknown_actor_ids': unknown_actor_ids
+    })
+
+
 '''
 GET /actors
     - public endpoint
     - contain only the actor.short() data representation
+    - ?include=movies adds the filmography of every actor
+    - ?min_age= and ?max_age= (inclusive) filter on the age,
+        ?sort=id|name|age (- prefix for descending) orders the actors
     - returns status code 200 and json {"success": True, "actors": actors}
         where actors is the list of actors
         or appropriate status code indicating reason for failure
 '''
 
 
-@app.route("/api/v1/actors")
+@api.route("/api/v1/actors")
 @requires_auth('view:actors')
 def get_long_repr_actors():
     page = request.args.get('page', 1, type=int)
-    actors = Actor.query.paginate(page, DATA_PER_PAGE, False)
-    formatted_actors = [actor.format() for actor in actors.items]
+    options, include = include_options(Actor, ('movies',))
+    query = Actor.query.options(*options)
+    min_age = query_filter('min_age', parse_age)
+    if min_age is not None:
+        query = query.filter(Actor.age >= min_age)
+    max_age = query_filter('max_age', parse_age)
+    if max_age is not None:
+        query = query.filter(Actor.age <= max_age)
+    actors = query.order_by(*sort_order(Actor, ('name', 'age')))\
+        .paginate(page, DATA_PER_PAGE, False)
+    formatted_actors = [actor.format(include) for actor in actors.items]
     return jsonify({
       'status': True,
       'actors': formatted_actors,
@@ -207,7 +413,7 @@ def get_long_repr_actors():
 '''
 
 
-@app.route("/api/v1/actors", methods=['POST'])
+@api.route("/api/v1/actors", methods=['POST'])
 @requires_auth('create:actors')
 def create_actor():
     data = request.get_json(force=True)
@@ -217,7 +423,7 @@ def create_actor():
         gender = data.get('gender')
         if None in [name, age, gender]:
             abort(422)
-        actor = Actor(name=name, age=age, gender=gender)
+        actor = Actor(name=name, age=parse_age(age), gender=gender)
         actor.insert()
         return jsonify({
             'status': True,
@@ -240,7 +446,7 @@ def create_actor():
 '''
 
 
-@app.route("/api/v1/actors/<int:actor_id>", methods=['PATCH'])
+@api.route("/api/v1/actors/<int:actor_id>", methods=['PATCH'])
 @requires_auth('patch:actors')
 def update_actor(actor_id):
     data = request.get_json(force=True)
@@ -250,7 +456,12 @@ def update_actor(actor_id):
         abort(404)
 
     name = data.get('name', actor.name)
-    age = data.get('age', actor.age)
+    age = actor.age
+    if 'age' in data:
+        try:
+            age = parse_age(data['age'])
+        except ValueError:
+            abort(422)
     gender = data.get('gender', actor.gender)
 
     actor.name = name
@@ -277,7 +488,7 @@ def update_actor(actor_id):
 '''
 
 
-@app.route("/api/v1/actors/<int:actor_id>", methods=['DELETE'])
+@api.route("/api/v1/actors/<int:actor_id>", methods=['DELETE'])
 @requires_auth('delete:actors')
 def delete_actor(actor_id):
     try:
@@ -296,13 +507,37 @@ def delete_actor(actor_id):
         abort(422)
 
 
+'''
+    GET /actors/<id>/movies
+        - it should require the 'view:actors' permission
+        - respond with a 404 error if <id> is not found
+        - ?after=<movie id> and ?limit= page through the movies ordered by id
+    returns status code 200 and json {"status": True, "movies": movies,
+        "next_after": id} where next_after is null on the last page
+'''
+
+
+@api.route("/api/v1/actors/<int:actor_id>/movies")
+@requires_auth('view:actors')
+def get_actor_movies(actor_id):
+    after, limit = keyset_args()
+    movies, next_after = actor_filmography(actor_id, after, limit)
+    if not movies:
+        exists_or_404(Actor, actor_id)
+    return jsonify({
+        'status': True,
+        'movies': [movie.format() for movie in movies],
+        'next_after': next_after
+    })
+
+
 # Error Handling
 '''
 Example error handling for unprocessable entity
 '''
 
 
-@app.errorhandler(422)
+@api.app_errorhandler(422)
 def unprocessable(error):
     return jsonify({
         "status": False,
@@ -316,7 +551,7 @@ Example error handling for bad request
 '''
 
 
-@app.errorhandler(400)
+@api.app_errorhandler(400)
 def bad_request(error):
     return jsonify({
         "status": False,
@@ -330,7 +565,7 @@ Error handling for resource not found
 '''
 
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def unprocessable(error):
     return jsonify({
         "status": False,
@@ -344,7 +579,7 @@ Error handling for method not allowed
 '''
 
 
-@app.errorhandler(405)
+@api.app_errorhandler(405)
 def unprocessable(error):
     return jsonify({
         "status": False,
@@ -358,7 +593,7 @@ Error handler for AuthError
 '''
 
 
-@app.errorhandler(AuthError)
+@api.app_errorhandler(AuthError)
 def auth_error_handling(error):
     return jsonify({
         "status": False,
@@ -368,4 +603,4 @@ def auth_error_handling(error):
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
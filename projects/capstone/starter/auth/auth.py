@@ -1,15 +1,49 @@
-import json
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+from jose import jwt, JWTError
 import os
 
+from fsnd_auth import JWKSCache, TokenCache, verify_signature
+
 
 AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
-ALGORITHMS = os.environ.get('ALGORITHMS')
+
+
+'''
+Allowed signing algorithms of the ALGORITHMS setting, a comma separated
+list such as RS256 or RS256,RS384. The brackets and quotes of the older
+['RS256'] form are ignored.
+'''
+
+
+def parse_algorithms(value):
+    return [
+        algorithm.strip(' \'"') for algorithm in value.strip('[] ').split(',')
+        if algorithm.strip(' \'"')
+    ]
+
+
+ALGORITHMS = parse_algorithms(os.environ.get('ALGORITHMS', 'RS256'))
 API_AUDIENCE = os.environ.get('API_AUDIENCE')
 
+'''
+Signing keys of the Auth0 tenant, shared by every request of the process.
+Set JWKS_PATH to read the key set from a local file instead of Auth0.
+'''
+jwks_cache = JWKSCache(
+    url=f'https://{AUTH0_DOMAIN}/.well-known/jwks.json',
+    path=os.environ.get('JWKS_PATH'),
+    ttl=int(os.environ.get('JWKS_CACHE_TTL', 600)),
+    min_refresh_interval=int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+)
+
+'''
+Payloads of already verified tokens, a token sent again before its exp
+claim skips the signature verification.
+token_cache.stats() reports hits and misses.
+'''
+token_cache = TokenCache(maxsize=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
 # AuthError Exception
 '''
 AuthError Exception
@@ -23,6 +57,56 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+# Permissions
+'''
+PermissionRequirement
+    the permissions an endpoint requires,
+    compiled once when requires_auth decorates it
+        all_of: every one of these permissions must be granted
+        any_of: at least one of these permissions must be granted
+'''
+
+
+class PermissionRequirement:
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = frozenset(all_of)
+        self.any_of = frozenset(any_of)
+
+    '''
+    compile(permission, any_of, all_of)
+        builds the requirement of a permission string (i.e. 'view:movies')
+        and optional any-of / all-of permission sets
+        an already compiled requirement is returned as is
+    '''
+
+    @classmethod
+    def compile(cls, permission='', any_of=(), all_of=()):
+        if isinstance(permission, cls):
+            return permission
+        all_of = set(all_of)
+        if permission or not (any_of or all_of):
+            all_of.add(permission)
+        return cls(all_of=all_of, any_of=any_of)
+
+    def satisfied_by(self, granted):
+        if not self.all_of <= granted:
+            return False
+        return not self.any_of or not self.any_of.isdisjoint(granted)
+
+
+'''
+VerifiedPayload
+    decoded jwt payload carrying the frozenset of its granted permissions,
+    built once per token so permission checks are set lookups
+'''
+
+
+class VerifiedPayload(dict):
+    def __init__(self, claims):
+        super().__init__(claims)
+        self.granted = frozenset(claims.get('permissions') or ())
+
+
 # Auth Header
 
 '''
@@ -66,11 +150,12 @@ def get_token_auth_header():
 '''
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+            or a compiled PermissionRequirement
         payload: decoded jwt payload
 
     raise an AuthError if permissions are not included in the payload
-    raise an AuthError if the requested permission string
-    is not in the payload permissions array
+    raise an AuthError if the requested permissions
+    are not granted by the payload permissions array
     return true otherwise
 '''
 
@@ -82,7 +167,11 @@ def check_permissions(permission, payload):
             'description': 'Permissions parameter in required in JWT payload.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    required = PermissionRequirement.compile(permission)
+    granted = getattr(payload, 'granted', None)
+    if granted is None:
+        granted = frozenset(payload['permissions'])
+    if not required.satisfied_by(granted):
         raise AuthError({
             'code': 'unauthorized',
             'description': 'Unauthorized access.'
@@ -96,43 +185,39 @@ def check_permissions(permission, payload):
 
     should be an Auth0 token with key id (kid)
     should verify the token using Auth0 /.well-known/jwks.json
+        (cached in jwks_cache)
     should decode the payload from the token
     should validate the claims
-    return the decoded payload
+    return the decoded payload as a VerifiedPayload
 '''
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
     if rsa_key:
         try:
+            # the signature is checked against the pre-built key object,
+            # jwt.decode only has to validate the claims
+            if unverified_header.get('alg') not in ALGORITHMS\
+                    or not verify_signature(token, rsa_key):
+                raise JWTError('Signature verification failed.')
             payload = jwt.decode(
                 token,
-                rsa_key,
+                None,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                issuer='https://' + AUTH0_DOMAIN + '/',
+                options={'verify_signature': False}
             )
 
-            return payload
+            return VerifiedPayload(payload)
 
         except jwt.ExpiredSignatureError:
             raise AuthError({
@@ -160,9 +245,13 @@ def verify_decode_jwt(token):
 '''
     @INPUTS
         permission: string permission (i.e. 'post:drink')
+        any_of: optional permissions of which at least one is required
+        all_of: optional permissions which are all required
 
+    compile the required permissions once, when the endpoint is decorated
     use the get_token_auth_header method to get the token
-    use the verify_decode_jwt method to decode the jwt
+    use the verify_decode_jwt method to decode the jwt,
+        unless token_cache already holds its payload
     use the check_permissions method validate claims
         and check the requested permission
     return the decorator which passes the decoded payload
@@ -170,13 +259,22 @@ def verify_decode_jwt(token):
 '''
 
 
-def requires_auth(permission=''):
+def requires_auth(permission='', any_of=(), all_of=()):
+    required = PermissionRequirement.compile(
+        permission,
+        any_of=any_of,
+        all_of=all_of
+    )
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = verify_decode_jwt(token)
+                token_cache.set(token, payload)
+            check_permissions(required, payload)
             return f(*args, **kwargs)
         return wrapper
     return requires_auth_decorator
@@ -0,0 +1,127 @@
+"""Typed and indexed release_date and age
+
+Revision ID: ee9d01eca1de
+Revises: a2b3d542df5f
+Create Date: 2026-10-18 11:10:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ee9d01eca1de'
+down_revision = 'a2b3d542df5f'
+branch_labels = None
+depends_on = None
+
+# release dates were stored as YYYY-MM-DD or MM/DD/YYYY strings and ages
+# as digit strings, values in other formats and impossible dates such as
+# 2020-02-31 can not be converted and become NULL.
+# on PostgreSQL the dates are built by make_date(), which raises on an
+# impossible date, in a temporary function catching that error so a single
+# bad row does not abort the migration
+RELEASE_DATE_FUNCTION = """
+    CREATE FUNCTION pg_temp.release_date_or_null(value varchar)
+    RETURNS date AS $$
+    DECLARE
+        parts text[];
+    BEGIN
+        parts := regexp_matches(trim(value),
+                                '^(\\d{4})-(\\d{1,2})-(\\d{1,2})$');
+        IF parts IS NOT NULL THEN
+            RETURN make_date(parts[1]::int, parts[2]::int, parts[3]::int);
+        END IF;
+        parts := regexp_matches(trim(value),
+                                '^(\\d{1,2})/(\\d{1,2})/(\\d{4})$');
+        IF parts IS NOT NULL THEN
+            RETURN make_date(parts[3]::int, parts[1]::int, parts[2]::int);
+        END IF;
+        RETURN NULL;
+    EXCEPTION WHEN datetime_field_overflow THEN
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+RELEASE_DATE_USING = 'pg_temp.release_date_or_null(release_date)'
+# up to 9 digits, longer strings would overflow the integer column
+AGE_USING = """
+    CASE
+        WHEN trim(age) ~ '^\\d{1,9}$' THEN trim(age)::integer
+    END
+"""
+
+
+def parse_release_date(value):
+    for date_format in ('%Y-%m-%d', '%m/%d/%Y'):
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+
+def parse_age(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() and len(value) <= 9 else None
+
+
+def optional_str(value):
+    return None if value is None else str(value)
+
+
+def convert_column(table, column, type_, convert):
+    # other databases: the values are converted in python into a new
+    # column which then replaces the old one
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.add_column(
+            sa.Column(column + '_converted', type_, nullable=True)
+        )
+    connection = op.get_bind()
+    source = sa.table(
+        table,
+        sa.column('id'),
+        sa.column(column),
+        sa.column(column + '_converted')
+    )
+    rows = connection.execute(
+        sa.select([source.c.id, source.c[column]])
+    ).fetchall()
+    for row in rows:
+        connection.execute(source.update()
+                           .where(source.c.id == row[0])
+                           .values({column + '_converted': convert(row[1])}))
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.drop_column(column)
+        batch_op.alter_column(column + '_converted', new_column_name=column)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(RELEASE_DATE_FUNCTION)
+        op.alter_column('movies', 'release_date', type_=sa.Date(),
+                        postgresql_using=RELEASE_DATE_USING)
+        op.execute('DROP FUNCTION pg_temp.release_date_or_null(varchar)')
+        op.alter_column('actors', 'age', type_=sa.Integer(),
+                        postgresql_using=AGE_USING)
+    else:
+        convert_column('movies', 'release_date', sa.Date(),
+                       parse_release_date)
+        convert_column('actors', 'age', sa.Integer(), parse_age)
+    op.create_index(op.f('ix_movies_release_date'), 'movies',
+                    ['release_date'], unique=False)
+    op.create_index(op.f('ix_actors_age'), 'actors', ['age'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_actors_age'), table_name='actors')
+    op.drop_index(op.f('ix_movies_release_date'), table_name='movies')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('actors', 'age', type_=sa.String(),
+                        postgresql_using='age::varchar')
+        op.alter_column('movies', 'release_date', type_=sa.String(),
+                        postgresql_using="to_char(release_date, 'YYYY-MM-DD')")
+    else:
+        convert_column('actors', 'age', sa.String(), optional_str)
+        convert_column('movies', 'release_date', sa.String(), optional_str)
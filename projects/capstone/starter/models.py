@@ -1,33 +1,58 @@
 import os
+import click
+from contextlib import contextmanager
 from sqlalchemy import (
   Column,
   String,
   Integer,
+  Date,
   create_engine,
   Table,
-  ForeignKey
+  ForeignKey,
+  and_,
+  exists,
+  literal,
+  select
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
-from flask_sqlalchemy import SQLAlchemy
+from flask.cli import with_appcontext
 import json
+from fsnd_db.engine import engine_options
+from fsnd_db.routing import RoutingSQLAlchemy
 
-database_path = os.environ['DATABASE_URL']
-
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    database_path defaults to the DATABASE_URL environment variable
+    nothing is sent to the database, the tables are created with
+    `flask create-db` or `python manage.py db upgrade`
 '''
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=None):
+    database_path = database_path or os.environ['DATABASE_URL']
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
+    app.cli.add_command(create_db_command)
+
+
+'''
+flask create-db
+    creates the missing tables
+'''
+
+
+@click.command('create-db')
+@with_appcontext
+def create_db_command():
     db.create_all()
+    click.echo('Created the database tables.')
 
 
 '''
@@ -44,6 +69,48 @@ def db_drop_and_create_all():
     db.create_all()
 
 
+'''
+unit_of_work()
+    stages the changes of every insert(), update() and delete() call made
+    inside the block and commits them once when it exits, or rolls them
+    all back when it raises. blocks can be nested, the outermost commits.
+    EXAMPLE
+        with unit_of_work():
+            movie.insert()
+            actor.insert()
+'''
+
+
+@contextmanager
+def unit_of_work():
+    depth = db.session.info.get('unit_of_work', 0)
+    db.session.info['unit_of_work'] = depth + 1
+    try:
+        yield db.session
+        if depth == 0:
+            db.session.commit()
+    except BaseException:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        db.session.info['unit_of_work'] = depth
+
+
+'''
+commit()
+    commits the session, or only flushes it inside a unit_of_work so
+    the ids are assigned and the commit is left to the block
+'''
+
+
+def commit():
+    if db.session.info.get('unit_of_work'):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
 actors_movies = db.Table(
                     'actors_movies',
                     db.Column(
@@ -71,12 +138,14 @@ class Movie(db.Model):
 
     id = Column(Integer, primary_key=True)
     title = Column(String)
-    release_date = Column(String)
+    release_date = Column(Date, index=True)
+    # not loaded unless asked for, see include_options in app.py
     actors = db.relationship(
                 'Actor',
                 secondary=actors_movies,
-                lazy='subquery',
-                backref=db.backref('actors_movies', lazy=True)
+                lazy='select',
+                order_by='Actor.id',
+                back_populates='movies'
             )
 
     def __init__(self, title, release_date):
@@ -85,21 +154,30 @@ class Movie(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def update(self):
-        db.session.commit()
+        commit()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
-
-    def format(self):
-        return {
+        commit()
+
+    '''
+    format(include)
+        include: related collections to add, i.e. ('actors',)
+        they should have been loaded with the query to avoid a query per movie
+    '''
+    def format(self, include=()):
+        data = {
             'id': self.id,
             'title': self.title,
-            'release_date': self.release_date
+            'release_date': self.release_date.isoformat()
+            if self.release_date else None
         }
+        if 'actors' in include:
+            data['actors'] = [actor.format() for actor in self.actors]
+        return data
 
 
 '''
@@ -113,13 +191,14 @@ class Actor(db.Model):
 
     id = Column(Integer, primary_key=True)
     name = Column(String)
-    age = Column(String)
+    age = Column(Integer, index=True)
     gender = Column(String)
     movies = db.relationship(
                 'Movie',
                 secondary=actors_movies,
-                lazy='subquery',
-                backref=db.backref('actors_movies', lazy=True)
+                lazy='select',
+                order_by='Movie.id',
+                back_populates='actors'
             )
 
     def __init__(self, name, age, gender):
@@ -129,19 +208,109 @@ class Actor(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def update(self):
-        db.session.commit()
+        commit()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
-
-    def format(self):
-        return {
+        commit()
+
+    '''
+    format(include)
+        include: related collections to add, i.e. ('movies',)
+        they should have been loaded with the query to avoid a query per actor
+    '''
+    def format(self, include=()):
+        data = {
             'id': self.id,
             'name': self.name,
             'age': self.age,
             'gender': self.gender
         }
+        if 'movies' in include:
+            data['movies'] = [movie.format() for movie in self.movies]
+        return data
+
+
+'''
+Cast queries
+    read and write the actors_movies association without loading
+    Movie.actors or Actor.movies, each call is a fixed number of queries
+    whatever the size of the cast
+'''
+
+
+def _related_page(model, owner_column, related_column, owner_id, after, limit):
+    rows = db.session.query(model)\
+        .join(actors_movies, related_column == model.id)\
+        .filter(owner_column == owner_id, model.id > after)\
+        .order_by(model.id)\
+        .limit(limit + 1)\
+        .all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+'''
+movie_cast(movie_id, after, limit)
+    one page of the actors of a movie, ordered by id, starting after the
+    actor id `after` (keyset pagination)
+    returns (actors, next_after), next_after is None on the last page
+'''
+
+
+def movie_cast(movie_id, after=0, limit=10):
+    return _related_page(
+        Actor,
+        actors_movies.c.movie_id,
+        actors_movies.c.actor_id,
+        movie_id, after, limit
+    )
+
+
+'''
+actor_filmography(actor_id, after, limit)
+    one page of the movies of an actor, see movie_cast
+'''
+
+
+def actor_filmography(actor_id, after=0, limit=10):
+    return _related_page(
+        Movie,
+        actors_movies.c.actor_id,
+        actors_movies.c.movie_id,
+        actor_id, after, limit
+    )
+
+
+'''
+assign_actors(movie_id, actor_ids)
+    adds the actors to the cast of a movie with a single INSERT ... SELECT,
+    actors already in the cast are skipped
+    returns (added, unknown_ids), unknown_ids lists the ids of no actor
+'''
+
+
+def assign_actors(movie_id, actor_ids):
+    actor_ids = set(actor_ids)
+    if not actor_ids:
+        return 0, []
+    known = {actor_id for actor_id, in db.session.query(Actor.id)
+             .filter(Actor.id.in_(actor_ids))}
+    if not known:
+        return 0, sorted(actor_ids)
+    already_cast = exists().where(and_(
+        actors_movies.c.actor_id == Actor.id,
+        actors_movies.c.movie_id == movie_id
+    ))
+    candidates = select([Actor.id, literal(movie_id)])\
+        .where(Actor.id.in_(known))\
+        .where(~already_cast)
+    result = db.session.execute(actors_movies.insert().from_select(
+        ['actor_id', 'movie_id'],
+        candidates
+    ))
+    commit()
+    return result.rowcount, sorted(actor_ids - known)
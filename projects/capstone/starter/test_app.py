@@ -3,9 +3,38 @@ import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 import random
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 
 from .app import create_app
-from .models import setup_db, Actor, Movie
+from .models import db, Actor, Movie, assign_actors, movie_cast, unit_of_work
+from fsnd_auth import JWKSCache, TokenCache
+from .auth.auth import (
+    AuthError,
+    PermissionRequirement,
+    VerifiedPayload,
+    check_permissions,
+    parse_algorithms
+)
+
+TEST_JWKS = {
+    'keys': [{
+        'alg': 'RS256',
+        'kty': 'RSA',
+        'use': 'sig',
+        'kid': 'test-key',
+        'e': 'AQAB',
+        'n': 'oEHMxgG69Y7C6GTGYu5iimPnBnEPyC98AOlT4f-NbW9HVCXntviq1vpsqBy8uq0V'
+             'zL7k36cRbi_7-ok9PQKb-CHtX2ImWLF6smIM0PpN-o7O4lUwAS7K1QtEvCGHE3vj'
+             'pQgtTKFQ6XVZ0fDysdj5z6GubC7qLpzfAvmaZ5M4UcH1E9pdQGHr1QPiQoveyDlN'
+             'XW2dyC2kGyysXQvmB_suDwi3VYHRJCRrqaVo8mARHxb6p14MVwUonI-uZS44WE_u'
+             'jLqqmdSEqFb7K6-4bCymLTMue0pHV9SkyK0s835hp8q3AGx2NL_J5ob09GFNbpTC'
+             'ZrSm05gTIY77dy9VScRgmQ'
+    }]
+}
 
 
 class CapstoneTestCase(unittest.TestCase):
@@ -13,13 +42,6 @@ class CapstoneTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        # get your Auth Bearer token from somewhere
-        self.headers = {
-            'Content-Type': 'application/json',
-            'Authorization': os.environ.get('PRODUCER')
-        }
         self.database_path = "postgresql://{}:{}@{}:{}/{}".format(
             os.getenv("TEST_DB_USERNAME"),
             os.getenv("TEST_DB_PASSWD"),
@@ -27,13 +49,18 @@ class CapstoneTestCase(unittest.TestCase):
             os.getenv("TEST_DB_PORT"),
             os.getenv("TEST_DB_NAME")
         )
-        setup_db(self.app, self.database_path)
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path})
+        self.client = self.app.test_client
+        # get your Auth Bearer token from somewhere
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': os.environ.get('PRODUCER')
+        }
 
         # binds the app to the current context
         with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
+            self.db = db
+            # create all tables, create_app does not touch the database
             self.db.create_all()
 
     def tearDown(self):
@@ -47,6 +74,181 @@ class CapstoneTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 200)
 
+    def test_get_movies_include_actors(self):
+        """Test list movies endpoint with their cast """
+        res = self.client().get('/api/v1/movies', headers=self.headers)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        for movie in data['movies']:
+            self.assertNotIn('actors', movie)
+
+        res = self.client().get(
+            '/api/v1/movies?include=actors',
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        for movie in data['movies']:
+            self.assertIsInstance(movie['actors'], list)
+
+    def test_400_get_movies_include(self):
+        """Test list movies endpoint with an unknown relationship """
+        res = self.client().get(
+            '/api/v1/movies?include=directors',
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['status'], False)
+
+    def test_get_movies_filters(self):
+        """Test list movies endpoint with release date filters """
+        for release_date in ('1990-05-01', '06/15/2021'):
+            res = self.client().post(
+                "/api/v1/movies",
+                json={
+                    'title': 'Movie title - filter unittest',
+                    'release_date': release_date
+                },
+                headers=self.headers
+            )
+            self.assertEqual(res.status_code, 200)
+
+        res = self.client().get(
+            '/api/v1/movies?released_after=2020-12-31&sort=-release_date',
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        release_dates = [movie['release_date'] for movie in data['movies']]
+        self.assertIn('2021-06-15', release_dates)
+        self.assertTrue(all(date > '2020-12-31' for date in release_dates))
+        self.assertEqual(release_dates, sorted(release_dates, reverse=True))
+
+    def test_get_actors_filters(self):
+        """Test list actors endpoint with age filters """
+        res = self.client().post(
+            "/api/v1/actors",
+            json={'name': 'Actor - filter unittest', 'age': '25',
+                  'gender': 'male'},
+            headers=self.headers
+        )
+        self.assertEqual(json.loads(res.data)['actors'][0]['age'], 25)
+
+        res = self.client().get(
+            '/api/v1/actors?min_age=20&max_age=30&sort=age',
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        ages = [actor['age'] for actor in data['actors']]
+        self.assertTrue(ages)
+        self.assertTrue(all(20 <= age <= 30 for age in ages))
+        self.assertEqual(ages, sorted(ages))
+
+    def test_400_get_movies_filters(self):
+        """Test list movies endpoint with invalid filters """
+        for query in ('released_after=tomorrow', 'sort=budget'):
+            res = self.client().get(
+                '/api/v1/movies?' + query,
+                headers=self.headers
+            )
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['status'], False)
+
+    def test_movie_actors(self):
+        """Test cast endpoints of a movie """
+        res = self.client().post(
+            "/api/v1/movies",
+            json={
+                'title': 'Movie title - cast unittest',
+                'release_date': '12/12/2020'
+            },
+            headers=self.headers
+        )
+        movie_id = json.loads(res.data)['movies'][0]['id']
+        actor_ids = []
+        for name in ('Actor one - unittest', 'Actor two - unittest'):
+            res = self.client().post(
+                "/api/v1/actors",
+                json={'name': name, 'age': 30, 'gender': 'female'},
+                headers=self.headers
+            )
+            actor_ids.append(json.loads(res.data)['actors'][0]['id'])
+
+        res = self.client().post(
+            "/api/v1/movies/{}/actors".format(movie_id),
+            json={'actor_ids': actor_ids + [actor_ids[0], 999999]},
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['added'], 2)
+        self.assertEqual(data['unknown_actor_ids'], [999999])
+
+        res = self.client().get(
+            "/api/v1/movies/{}/actors?limit=1".format(movie_id),
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([a['id'] for a in data['actors']], actor_ids[:1])
+
+        res = self.client().get(
+            "/api/v1/movies/{}/actors?limit=1&after={}".format(
+                movie_id,
+                data['next_after']
+            ),
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual([a['id'] for a in data['actors']], actor_ids[1:])
+        self.assertEqual(data['next_after'], None)
+
+        res = self.client().get(
+            "/api/v1/actors/{}/movies".format(actor_ids[0]),
+            headers=self.headers
+        )
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(movie_id, [movie['id'] for movie in data['movies']])
+
+    def test_assign_actors_joins_unit_of_work(self):
+        """Test casting inside a unit of work is rolled back with it """
+        with self.app.app_context():
+            movie = Movie('Movie title - unit of work unittest', date(2020, 12, 12))
+            actor = Actor('Actor - unit of work unittest', 30, 'female')
+            with unit_of_work():
+                movie.insert()
+                actor.insert()
+
+            with self.assertRaises(RuntimeError):
+                with unit_of_work():
+                    self.assertEqual(assign_actors(movie.id, [actor.id]), (1, []))
+                    raise RuntimeError('rolled back')
+            self.assertEqual(movie_cast(movie.id)[0], [])
+
+            with unit_of_work():
+                movie.delete()
+                actor.delete()
+
+    def test_404_movie_actors(self):
+        """Test cast endpoints Error handling endpoint """
+        res = self.client().get(
+            "/api/v1/movies/999999/actors",
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().post(
+            "/api/v1/movies/999999/actors",
+            json={'actor_ids': [1]},
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 404)
+
     def test_405_get_movies(self):
         """Test list movies Error handling endpoint """
         res = self.client().put('/api/v1/movies', headers=self.headers)
@@ -348,6 +550,247 @@ class CapstoneTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['status'], True)
 
+    def test_create_app_does_not_query(self):
+        """Test the application starts without talking to the database """
+        statements = []
+
+        def listener(*args):
+            statements.append(args[2])
+
+        event.listen(Engine, 'before_cursor_execute', listener)
+        try:
+            create_app({'SQLALCHEMY_DATABASE_URI': self.database_path})
+        finally:
+            event.remove(Engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+
+    def test_create_db_command(self):
+        """Test the create-db command """
+        result = self.app.test_cli_runner().invoke(args=['create-db'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Created', result.output)
+
+    def test_metrics(self):
+        """Test the request metrics endpoint """
+        client = self.app.test_client()
+        res = client.get('/api/v1/movies', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+
+        res = client.get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        text = res.data.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{'
+            'endpoint="api.get_long_repr_movies",method="GET"} 1',
+            text
+        )
+        self.assertIn(
+            'http_requests_total{'
+            'endpoint="api.get_long_repr_movies",method="GET",status="200"} 1',
+            text
+        )
+        self.assertIn(
+            'http_request_sql_statements_total{'
+            'endpoint="api.get_long_repr_movies"}',
+            text
+        )
+        self.assertIn('db_pool_checkouts_total', text)
+
+    def test_404_metrics(self):
+        """Test the metrics are only served to local clients """
+        res = self.client().get(
+            '/metrics',
+            environ_base={'REMOTE_ADDR': '10.0.0.1'}
+        )
+        self.assertEqual(res.status_code, 404)
+
+    def test_read_replica(self):
+        """Test reads go to the replica until the client writes """
+        replica_path = 'sqlite:///{}'.format(
+            os.path.join(tempfile.mkdtemp(), 'replica.db')
+        )
+        replica = create_engine(replica_path)
+        db.metadata.create_all(replica)
+        replica.execute(Movie.__table__.insert(), {
+            'title': 'Movie title - unittest replica',
+            'release_date': date(2020, 1, 1)
+        })
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': self.database_path,
+            'DATABASE_REPLICA_URLS': replica_path
+        })
+
+        def titles(client):
+            res = client.get('/api/v1/movies?sort=-id', headers=self.headers)
+            self.assertEqual(res.status_code, 200)
+            return [movie['title'] for movie in json.loads(res.data)['movies']]
+
+        client = app.test_client()
+        self.assertEqual(titles(client), ['Movie title - unittest replica'])
+
+        res = client.post(
+            "/api/v1/movies",
+            json={
+                'title': 'Movie title - unittest primary',
+                'release_date': '2020-01-01'
+            },
+            headers=self.headers
+        )
+        self.assertEqual(res.status_code, 200)
+        # the client reads its own write from the primary
+        self.assertEqual(
+            titles(client)[0],
+            'Movie title - unittest primary'
+        )
+        # other clients still read from the replica
+        self.assertEqual(
+            titles(app.test_client()),
+            ['Movie title - unittest replica']
+        )
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the signing keys cache test case"""
+
+    def setUp(self):
+        self.jwks_file = tempfile.NamedTemporaryFile('w', suffix='.json')
+        json.dump(TEST_JWKS, self.jwks_file)
+        self.jwks_file.flush()
+        self.cache = JWKSCache(path=self.jwks_file.name, ttl=600)
+        self.fetches = 0
+        fetch = self.cache._fetch
+
+        def counting_fetch():
+            self.fetches += 1
+            return fetch()
+        self.cache._fetch = counting_fetch
+
+    def tearDown(self):
+        self.jwks_file.close()
+
+    def test_keys_are_fetched_once(self):
+        """Test known key ids are served from memory """
+        first = self.cache.get_key('test-key')
+        second = self.cache.get_key('test-key')
+
+        self.assertIsNotNone(first)
+        self.assertIs(first, second)
+        self.assertEqual(self.fetches, 1)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        """Test unknown key ids do not cause a fetch per request """
+        self.cache.get_key('test-key')
+        for i in range(10):
+            self.assertIsNone(self.cache.get_key('unknown-{}'.format(i)))
+
+        self.assertEqual(self.fetches, 1)
+
+    def test_expired_keys_are_fetched_again(self):
+        """Test the key set is fetched again after its ttl """
+        self.cache.ttl = 0
+        self.cache.get_key('test-key')
+        self.cache.get_key('test-key')
+
+        self.assertEqual(self.fetches, 2)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified tokens cache test case"""
+
+    def setUp(self):
+        self.cache = TokenCache(maxsize=2)
+        self.payload = {'exp': time.time() + 60, 'permissions': []}
+
+    def test_cached_token_is_a_hit(self):
+        """Test a token is verified once until its exp claim """
+        self.assertIsNone(self.cache.get('token'))
+        self.cache.set('token', self.payload)
+
+        self.assertIs(self.cache.get('token'), self.payload)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expired_token_is_a_miss(self):
+        """Test entries expire at the exp claim """
+        self.cache.set('token', {'exp': time.time() - 1})
+        self.cache.set('no-exp', {'permissions': []})
+
+        self.assertIsNone(self.cache.get('token'))
+        self.assertIsNone(self.cache.get('no-exp'))
+
+    def test_least_recently_used_token_is_evicted(self):
+        """Test the cache stays bounded """
+        self.cache.set('first', self.payload)
+        self.cache.set('second', self.payload)
+        self.cache.get('first')
+        self.cache.set('third', self.payload)
+
+        self.assertIsNotNone(self.cache.get('first'))
+        self.assertIsNone(self.cache.get('second'))
+        self.assertEqual(self.cache.stats()['size'], 2)
+
+
+class PermissionsTestCase(unittest.TestCase):
+    """This class represents the compiled permissions test case"""
+
+    def setUp(self):
+        self.payload = VerifiedPayload({
+            'permissions': ['view:movies', 'view:actors']
+        })
+
+    def test_payload_carries_granted_permissions(self):
+        """Test the granted permissions are built once per payload """
+        self.assertEqual(
+            self.payload.granted,
+            frozenset(['view:movies', 'view:actors'])
+        )
+
+    def test_single_permission(self):
+        """Test a permission string is required """
+        self.assertTrue(check_permissions('view:movies', self.payload))
+        with self.assertRaises(AuthError):
+            check_permissions('delete:movies', self.payload)
+
+    def test_any_of_and_all_of_permissions(self):
+        """Test any-of and all-of permission sets """
+        any_of = PermissionRequirement.compile(
+            any_of=['delete:movies', 'view:movies']
+        )
+        all_of = PermissionRequirement.compile(
+            all_of=['delete:movies', 'view:movies']
+        )
+
+        self.assertTrue(check_permissions(any_of, self.payload))
+        with self.assertRaises(AuthError):
+            check_permissions(all_of, self.payload)
+
+    def test_missing_permissions_claim(self):
+        """Test the permissions claim is required """
+        with self.assertRaises(AuthError):
+            check_permissions('view:movies', VerifiedPayload({}))
+
+
+class AlgorithmsTestCase(unittest.TestCase):
+    """This class represents the ALGORITHMS setting test case"""
+
+    def test_algorithms_are_a_list(self):
+        """Test the setting is split on commas """
+        self.assertEqual(parse_algorithms('RS256'), ['RS256'])
+        self.assertEqual(
+            parse_algorithms('RS256, RS384'),
+            ['RS256', 'RS384']
+        )
+
+    def test_bracketed_algorithms(self):
+        """Test the older ['RS256'] form is accepted """
+        self.assertEqual(parse_algorithms("['RS256']"), ['RS256'])
+        self.assertEqual(parse_algorithms('[RS256]'), ['RS256'])
+
+    def test_algorithm_is_not_a_substring_match(self):
+        """Test a part of an allowed algorithm is not allowed """
+        self.assertNotIn('RS', parse_algorithms('RS256'))
+        self.assertNotIn('', parse_algorithms('RS256,'))
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":